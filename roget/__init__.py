@@ -1,4 +1,4 @@
-__all__ = [ 'RogetBuilder', 'RogetThesaurus', 'RogetNode', 'Sense', 'HeadWord', 'RogetThesaususFormatterText', 'RogetThesaurusFormatterXML', 'ROGET_NODE_CATEGORY', 'ROGET_NODE_HEADWORD', 'ROGET_NODE_SENSE_GROUP', 'ROGET_NODE_SENSE', 'WORD_TYPE_NONE', 'WORD_TYPE_VERB', 'WORD_TYPE_NOUN', 'WORD_TYPE_ADJ', 'WORD_TYPE_ADVERB', 'WORD_TYPE_PHRASE' ]
-
-from roget.roget_parser import RogetBuilder, RogetThesaurus, RogetNode, Sense, HeadWord, RogetThesaususFormatterText, RogetThesaurusFormatterXML, RogetThesaurusFormatterXML, ROGET_NODE_CATEGORY, ROGET_NODE_HEADWORD, ROGET_NODE_SENSE_GROUP, ROGET_NODE_SENSE, WORD_TYPE_NONE, WORD_TYPE_VERB, WORD_TYPE_NOUN, WORD_TYPE_ADJ, WORD_TYPE_ADVERB, WORD_TYPE_PHRASE
-
+__all__ = [ 'RogetBuilder', 'RogetThesaurus', 'RogetThesaurusArrays', 'RogetNode', 'Sense', 'HeadWord', 'RogetThesaususFormatterText', 'RogetThesaurusFormatterXML', 'RogetThesaurusFormatterJSONL', 'ROGET_NODE_CATEGORY', 'ROGET_NODE_HEADWORD', 'ROGET_NODE_SENSE_GROUP', 'ROGET_NODE_SENSE', 'WORD_TYPE_NONE', 'WORD_TYPE_VERB', 'WORD_TYPE_NOUN', 'WORD_TYPE_ADJ', 'WORD_TYPE_ADVERB', 'WORD_TYPE_PHRASE' ]
+
+from roget.roget_parser import RogetBuilder, RogetThesaurus, RogetThesaurusArrays, RogetNode, Sense, HeadWord, RogetThesaususFormatterText, RogetThesaurusFormatterXML, RogetThesaurusFormatterJSONL, ROGET_NODE_CATEGORY, ROGET_NODE_HEADWORD, ROGET_NODE_SENSE_GROUP, ROGET_NODE_SENSE, WORD_TYPE_NONE, WORD_TYPE_VERB, WORD_TYPE_NOUN, WORD_TYPE_ADJ, WORD_TYPE_ADVERB, WORD_TYPE_PHRASE
+
@@ -4,15 +4,33 @@ import sys
 import re
 import os
 import time
+import gc
+import gzip
+import mmap
+import struct
+import zlib
+import bisect
+import contextlib
+import itertools
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Mapping
 
-__all__ = [ 'RogetBuilder', 'RogetThesaurus', 'RogetNode', 'Sense', 'HeadWord', 'RogetThesaususFormatterText', 'RogetThesaurusFormatterXML', 'ROGET_NODE_CATEGORY', 'ROGET_NODE_HEADWORD', 'ROGET_NODE_SENSE_GROUP', 'ROGET_NODE_SENSE', 'WORD_TYPE_NONE', 'WORD_TYPE_VERB', 'WORD_TYPE_NOUN', 'WORD_TYPE_ADJ', 'WORD_TYPE_ADVERB', 'WORD_TYPE_PHRASE' ]
-
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
+from json.encoder import encode_basestring as _encodeJsonString
 
 try:
-    import cPickle as pickle
-except Exception:
-    print( 'failed to load cPicle' )
+    import orjson
+except ImportError:
+    orjson = None
+
+__all__ = [ 'RogetBuilder', 'RogetThesaurus', 'RogetThesaurusArrays', 'RogetNode', 'Sense', 'HeadWord', 'RogetThesaususFormatterText', 'RogetThesaurusFormatterXML', 'RogetThesaurusFormatterJSONL', 'ROGET_NODE_CATEGORY', 'ROGET_NODE_HEADWORD', 'ROGET_NODE_SENSE_GROUP', 'ROGET_NODE_SENSE', 'WORD_TYPE_NONE', 'WORD_TYPE_VERB', 'WORD_TYPE_NOUN', 'WORD_TYPE_ADJ', 'WORD_TYPE_ADVERB', 'WORD_TYPE_PHRASE' ]
+
 
 """ types of nodes in tree """
 ROGET_NODE_CATEGORY = 1
@@ -29,304 +47,732 @@ WORD_TYPE_ADJ  = 3
 WORD_TYPE_ADVERB  =  4
 WORD_TYPE_PHRASE = 5
 
-""" last counter of nodes """
-_lastInternalId = 1
-
+""" the names of the node types and of the word types in the text report """
+_NODE_TYPE_NAMES = { ROGET_NODE_CATEGORY : "Category", ROGET_NODE_HEADWORD : "Headword", ROGET_NODE_SENSE_GROUP : "SenseGroup",
+                     ROGET_NODE_SENSE : "Sense" }
+_WORD_TYPE_NAMES = { WORD_TYPE_ADJ : 'Adj', WORD_TYPE_VERB : 'V', WORD_TYPE_ADVERB : 'Adv', WORD_TYPE_NOUN : 'N', WORD_TYPE_PHRASE : 'Phr' }
+
+""" child list of all leaf nodes (shared) """
+_NO_CHILDREN = ()
+
+""" binary snapshot format (see RogetBuilder.load) """
+_SNAPSHOT_MAGIC = b'ROGETSNP'
+_SNAPSHOT_VERSION = 2
+# magic, version, node count, string count, string blob size, head word count, sense key count, sense posting count
+_SNAPSHOT_HEADER = struct.Struct('<8sIIIIIII')
+# node columns, one array per column, in the order they appear in the file
+_SNAPSHOT_COLUMNS = ( ('type', 'B'), ('wordType', 'B'), ('parent', 'i'), ('firstChild', 'i'), ('nextSibling', 'i'),
+                      ('key', 'i'), ('description', 'i'), ('comment', 'i'), ('link', 'i'), ('linkComment', 'i'), ('index', 'i') )
+
+""" offset index of the head words of the text (see RogetBuilder.getHeadWord) """
+_OFFSET_INDEX_MAGIC = b'ROGETIDX'
+_OFFSET_INDEX_VERSION = 1
+# magic, version, head word count, size and modification time (in nanoseconds) of the text, size of the head word indexes
+_OFFSET_INDEX_HEADER = struct.Struct('<8sIIqqI')
+# columns, one entry per head word, in the order they appear in the file
+_OFFSET_INDEX_COLUMNS = ( ('offset', 'q'), ('length', 'i'), ('internalId', 'i'), ('count', 'i') )
+
+""" codes of the similarity signatures: the score rank of the node type above the internal id (see RogetThesaurus.semanticSimilarity) """
+_SIGNATURE_SHIFT = 32
+_SIGNATURE_LEVEL = { ROGET_NODE_SENSE_GROUP : 0 << _SIGNATURE_SHIFT, ROGET_NODE_HEADWORD : 1 << _SIGNATURE_SHIFT,
+                     ROGET_NODE_CATEGORY : 2 << _SIGNATURE_SHIFT }
+_SIGNATURE_ID_MASK = ( 1 << _SIGNATURE_SHIFT ) - 1
+_SIGNATURE_SCORE = ( 100, 90, 80 )
+# signature of a word that is not in the thesaurus
+_NO_SIGNATURE = ( (), () )
+
+def _hashTableSize( count ):
+    """ size of the hash tables of a snapshot: the power of two that is at least twice the number of entries """
+    size = 1
+    while size < 2 * count:
+        size *= 2
+    return size
+
+def _stringHash( s ):
+    """ hash of the utf-8 bytes of a string in a snapshot (the hash of str differs between processes) """
+    return zlib.crc32( s )
+
+_gcLock = threading.Lock()
+_gcPauseCount = 0
+_gcWasEnabled = False
+
+@contextlib.contextmanager
+def _pausedGC():
+    """ pauses the cyclic garbage collector while a tree is built; it would otherwise run many times over the new nodes
+        builds can run in several threads at once, the collector is enabled again when the last of them is done """
+    global _gcPauseCount, _gcWasEnabled
+    with _gcLock:
+        if _gcPauseCount == 0:
+            _gcWasEnabled = gc.isenabled()
+            gc.disable()
+        _gcPauseCount += 1
+    try:
+        yield
+    finally:
+        with _gcLock:
+            _gcPauseCount -= 1
+            if _gcPauseCount == 0 and _gcWasEnabled:
+                gc.enable()
+
+def _universalNewlines( text ):
+    """ text with the line ends \\r\\n and \\r translated to \\n, as in a file that is read in text mode """
+    if '\r' in text:
+        text = text.replace( '\r\n', '\n' ).replace( '\r', '\n' )
+    return text
+
+@contextlib.contextmanager
+def _replacedFile( file ):
+    """ yields a binary file that is written in place of file: the data goes to a temporary file in the same directory,
+        that replaces file (with os.replace) once the block is done, and that is removed if the block fails.
+        processes that have opened or mapped file keep reading the old copy, and never see a partial file """
+    tmpFile = '%s.%d.%d.tmp' % ( file, os.getpid(), threading.get_ident() )
+    try:
+        with open( tmpFile, 'wb' ) as f:
+            yield f
+        os.replace( tmpFile, file )
+    except BaseException:
+        if os.access( tmpFile, os.F_OK ):
+            os.remove( tmpFile )
+        raise
+
+""" the traversals of the tree use an explicit stack instead of recursion, so that the depth of the tree is not limited
+    by the recursion limit or by the stack size of the thread """
+
+def _iterPreorder( node ):
+    """ yields all nodes of the subtree in preorder, without recursion """
+    stack = [ node ]
+    while stack:
+        node = stack.pop()
+        yield node
+        if node._child:
+            stack.extend( reversed( node._child ) )
+
+def _leafTypes( mask ):
+    """ the node types below which a walk that only visits the node types in mask does not need to go (the leafTypes of
+        _iterPreorderDepth): there are no categories and head words below a head word """
+    return ROGET_NODE_HEADWORD if mask & ( ROGET_NODE_SENSE_GROUP | ROGET_NODE_SENSE ) == 0 else 0
+
+def _iterPreorderDepth( node, depth = 0, leafTypes = 0 ):
+    """ yields the tuple ( depth, node ) for all nodes of the subtree in preorder, without recursion; node is at the given depth.
+        the nodes below the nodes with a type in the mask leafTypes are skipped """
+    stack = [ ( depth, node ) ]
+    pop = stack.pop
+    push = stack.append
+    while stack:
+        item = pop()
+        yield item
+        if leafTypes and item[1]._type & leafTypes:
+            continue
+        children = item[1]._child
+        if children:
+            depth = item[0] + 1
+            for c in reversed( children ):
+                push( ( depth, c ) )
+
+def _iterPostorder( node ):
+    """ yields all nodes of the subtree in postorder (each node after the nodes below it), without recursion """
+    # the nodes on the path to the current node, with the iterators over their remaining children
+    stack = [ ( node, iter( node._child ) ) ]
+    while stack:
+        (node, children) = stack[-1]
+        for c in children:
+            if c._child:
+                stack.append( ( c, iter( c._child ) ) )
+                break
+            yield c
+        else:
+            stack.pop()
+            yield node
 
 
 class RogetBuilder:
     """
         The main entry point of this library; builds an instances of RogetThesaurus
     """
-    _RECURSION_LIMIT = 4500
     _VERBOSE = 1
 
     #_wordGroupBoundaryRe = re.compile( '((\&amp;c\s+(\([^\)]+\))?\s*[^\s\,\;]+\.?|\[[^]]+\]|[^;])+)' )
-    _wordGroupBoundaryRe = re.compile( r'((\&amp;c\s+(\([^\)]+\))?\s*[^\s^\,^\;^\.]+|\[[^]]+\]|\.(?!\n)|[^\;^\.])+)' )
-    _wordBoundaryRe = re.compile( r'((\&amp;c\s+(\([^\)]+\))?\s*[^\s^\,^\;^\.]+\.?|\[[^]]+\]|[^,])+)' )
+    # a link, a comment or a run of other characters (matched as a whole so that the regex engine does not loop per character)
+    _wordGroupBoundaryRe = re.compile( r'(?:\&amp;c\s+(?:\([^\)]+\))?\s*[^\s^\,^\;^\.]+|\[[^]]+\]|\.(?!\n)|[^\;^\.\&\[]+|[\&\[])+' )
+    _wordBoundaryRe = re.compile( r'(?:\&amp;c\s+(?:\([^\)]+\))?\s*[^\s^\,^\;^\.]+\.?|\[[^]]+\]|[^,\&\[]+|[\&\[])+' )
     _startHeadWordRe = re.compile(r"^\s*([0-9]+[a-z]*)?.\s*(\[[^\]]*\])?([^\-]+)\-")
-    _linkRe = re.compile( r'\&amp;c\s+(\([^\)]+\))?\s*([^\s^\,^\;^\.]+)\.?' )
     _commentRe = re.compile(r'\[([^\]]*)\]')
-    _attributeRe = re.compile(r'(N\.|Adj\.|Adv\.|V\.|Phr\.)')
+    # one scan over the text of a word: comment | link with optional attribute | word type annotation
+    _senseTokenRe = re.compile( r'\[([^\]]*)\]|\&amp;c\s+(\([^\)]+\))?\s*([^\s^\,^\;^\.]+)\.?|(N\.|Adj\.|Adv\.|V\.|Phr\.)' )
+    _LINK_WORD_TYPES = { 'adj' : WORD_TYPE_ADJ, 'adj.' : WORD_TYPE_ADJ, 'v' : WORD_TYPE_VERB, 'v.' : WORD_TYPE_VERB,
+                         'adv' : WORD_TYPE_ADVERB, 'adv.' : WORD_TYPE_ADVERB, 'n' : WORD_TYPE_NOUN, 'phr' : WORD_TYPE_PHRASE }
+    _ATTRIBUTE_WORD_TYPES = { 'V.' : WORD_TYPE_VERB, 'N.' : WORD_TYPE_NOUN, 'Adj.' : WORD_TYPE_ADJ,
+                              'Adv.' : WORD_TYPE_ADVERB, 'Phr.' : WORD_TYPE_PHRASE }
     _cleanupRe = re.compile(r'[\^\n]')
     _cleanupRe2 = re.compile(r'\s\s+')
     _numRe = re.compile(r'(\d+)')
-
-    _headWordIndex = {}
-    _senseIndex = {}
-    _lastHeadIndex  = None
-
-    def __init__(self, verbose = 0):
+    # a passage is a run of non blank lines
+    _passageRe = re.compile(r'(?:[^\S\n]*\S[^\n]*(?:\n|\Z))+')
+    _passageTypeRe = re.compile(r'(CLASS)|(DIVISION)|(SECTION)|([0-9]+\.? [A-Z][A-Z,\s]+)')
+    _PASSAGE_CLASS = 1
+    _PASSAGE_DIVISION = 2
+    _PASSAGE_SECTION = 3
+    _PASSAGE_SUBSECTION = 4
+
+    def __init__(self, verbose = 0, textFile = None):
+        """ textFile is the path of the text of the thesaurus; the default is the file 10681-body.py next to this module """
         self._VERBOSE = verbose
+        if textFile == None:
+            textFile = os.path.join(os.path.dirname(__file__), '10681-body.py' )
+        self._textFile = textFile
+        self._headWordOffsets = None
+        self._resetIndexes()
+
+    def _resetIndexes(self):
+        """ each parse builds its own indexes, so that each RogetThesaurus is independent of the others """
+        self._headWordIndex = {}
+        self._senseIndex = {}
+        self._lastHeadIndex = None
+
+    @staticmethod
+    def _resolveLink( node, headWordIndex ):
+        """ replaces the link of node (the index of a head word) with the head word; a node without a key of its own
+            gets the key of the head word """
+        link = headWordIndex.get( node._link )
+        if link == None:
+            raise Exception("word: " + node._key   + " unresolved link: " + str( node._link ) )
+        node._link = link
+        if node._key == '':
+            node._key = link._key
+
+    def _resolveReference( self, root ):
+        """ resolves the links, builds the sense index and numbers the nodes in preorder
+            (the internal ids of a tree only depend on the tree, not on other builds) """
+        headWordIndex = self._headWordIndex
+        senseIndex = self._senseIndex
+        internalId = 1
+        for node in _iterPreorder( root ):
+            node._internalId = internalId
+            internalId += 1
+            if node._type == ROGET_NODE_HEADWORD or node._type == ROGET_NODE_SENSE:
+                if node._link != None:
+                    self._resolveLink( node, headWordIndex )
+
+                senses = senseIndex.get( node._key )
+                if senses == None:
+                    senseIndex[ node._key ] = [ node ]
+                else:
+                    # all senses with the same key share one string
+                    node._key = senses[0]._key
+                    senses.append( node )
+
+    def _resolveLazyReference( self, root ):
+        """ _resolveReference for a tree of _parseText with a _LazyText: numbers the nodes in preorder (the nodes below
+            a head word are counted, but not created yet) and resolves the links of the head words """
+        headWordIndex = self._headWordIndex
+        internalId = 1
+        stack = [ root ]
+        while stack:
+            node = stack.pop()
+            node._internalId = internalId
+            internalId += 1
+            if node._type == ROGET_NODE_HEADWORD:
+                internalId += node._lazy[3]
+                if node._link != None:
+                    self._resolveLink( node, headWordIndex )
+            elif node._child:
+                stack.extend( reversed( node._child ) )
 
-    def _resolveReference( self, node ):
-        if node.type == ROGET_NODE_HEADWORD or node.type == ROGET_NODE_SENSE:
-            if node.link != None:
-                if not node._link in self._headWordIndex:
-                    raise Exception("word: " + node.key   + " unresolved link: " + str( node.link ) )
-                node._link = self._headWordIndex[ node._link ]
+    def _parseWord(self, word, text ):
+        textCopy = text
 
-        if node._type == ROGET_NODE_HEADWORD or node._type == ROGET_NODE_SENSE:
-            if node.key == '' and node.link != None:
-                node._key = node._link._key
-            if node._key not in self._senseIndex:
-                self._senseIndex[ node._key ] = []
-            self._senseIndex[ node._key ].append( node )
+        # fast path: annotations start with '[' (comment) or '&' (link) or end with '.' (word type)
+        if '[' in text or '&' in text or '.' in text:
+            n = None
+            if '[' in text and '&amp;c' in text:
+                # a link may span a comment; comments are removed before the link is searched
+                n = self._commentRe.search( text )
+                if n:
+                    text = self._commentRe.sub( '', text )
+            parts = self._senseTokenRe.split( text )
+            if n:
+                parts[ 1 : 1 ] = [ n.group(1), None, None, None, '' ]
+            if len(parts) > 1:
+                self._parseSenseTokens( word, parts )
+                text = ''.join( parts[ 0 : : 5 ] )
+
+        if '\n' in text:
+            text = text.replace( '\n', ' ' )
+        if '^' in text:
+            text = text.replace( '^', ' ' )
+        if '  ' in text or '\t' in text:
+            text = self._cleanupRe2.sub( ' ', text )
 
-        for n  in node.child:
-            self._resolveReference( n )
+        word._key = text.strip()
 
-    def _parseWord(self, word, text ):
-        textCopy = text
+        if word._key == '' and word.link == '':
+            raise Exception('empty word : ' + textCopy)
 
-        n = self._commentRe.search( text )
-        if n:
-            commentText = n.group(1).strip()
-            if self._cleanupRe.search( commentText ):
+    def _parseSenseTokens(self, word, parts ):
+        """ takes the annotations of a word from the result of _senseTokenRe.split;
+            the first comment, the first link and the first word type annotation count """
+        comment = None
+        link = None
+        attribute = None
+        for i in range( 1, len(parts), 5 ):
+            if parts[i] != None:
+                if comment == None:
+                    comment = parts[i]
+            elif parts[i+2] != None:
+                if link == None:
+                    link = i
+            elif attribute == None:
+                attribute = parts[i+3]
+
+        if comment != None:
+            commentText = comment.strip()
+            if '\n' in commentText or '^' in commentText:
                 commentText = self._cleanupRe.sub( '', commentText )
-            word._comment = commentText.strip()
-            text = self._commentRe.sub( '', text )
-        n = self._linkRe.search( text )
-        if n:
-            attribValue = n.group(1)
-            linkValue = n.group(2)
+            # few distinct comments ([Lat.], [Fr.] ...) are repeated many times
+            word._comment = sys.intern( commentText.strip() )
 
-            if attribValue == None and linkValue == None:
-                raise Exception('Bad link: ' + text)
+        if link != None:
+            attribValue = parts[ link + 1 ]
+            linkValue = parts[ link + 2 ]
 
             if attribValue == None:
                 attribValue = linkValue
                 linkValue = None
 
-            if attribValue != None:
-                lowerAttrib = attribValue.lower()
-                if lowerAttrib == 'adj' or  lowerAttrib == 'adj.':
-                    word._wordType = WORD_TYPE_ADJ
-                elif lowerAttrib == 'v' or lowerAttrib == 'v.':
-                    word._wordType = WORD_TYPE_VERB
-                elif lowerAttrib == 'adv' or lowerAttrib == 'adv.':
-                    word._wordType  = WORD_TYPE_ADVERB
-                elif lowerAttrib == 'n':
-                    word._wordType = WORD_TYPE_NOUN
-                elif lowerAttrib == 'phr':
-                    word._wordType = WORD_TYPE_PHRASE
-                elif lowerAttrib[0].isdigit():
-                    linkValue = lowerAttrib
+            lowerAttrib = attribValue.lower()
+            wordType = self._LINK_WORD_TYPES.get( lowerAttrib )
+            if wordType != None:
+                word._wordType = wordType
+            elif lowerAttrib[0].isdigit():
+                linkValue = lowerAttrib
 
             if linkValue != None:
                 word._link = linkValue.strip()
-            text = self._linkRe.sub( '', text)
-
-        n = self._attributeRe.search( text )
-        if n:
-            val = n.group(1)
-            if val == 'V.':
-                word._wordType = WORD_TYPE_VERB
-            elif val == 'N.':
-                word._wordType = WORD_TYPE_NOUN
-            elif val == 'Adj.':
-                word._wordType = WORD_TYPE_ADJ
-            elif val == 'Adv.':
-                word._wordType = WORD_TYPE_ADVERB
-            elif val == 'Phr.':
-                word._wordType = WORD_TYPE_PHRASE
-            else:
-                raise Exception(val + " -- " + text)
-            text = self._attributeRe.sub( '', text )
-
-        #n = self.linkType2.search( text )
-        #if n:
-        #    # TODO: extract link type
-        #    text = self.linkType2.sub( '', text )
-
-        if self._cleanupRe.search( text ):
-            text = self._cleanupRe.sub( ' ', text )
-
-        if self._cleanupRe2.search( text ):
-            text = self._cleanupRe2.sub( ' ', text )
 
-        word._key = text.strip()
+        if attribute != None:
+            word._wordType = self._ATTRIBUTE_WORD_TYPES[ attribute ]
 
-        if word._key == '' and word.link == '':
-            raise Exception('empty word : ' + textCopy)
-        #print( word.key )
+    def _checkHeadIndex(self, index ):
+        """ head words are numbered without gaps """
+        n = self._numRe.match( index )
+        if n != None:
+            if self._lastHeadIndex != None and (int(n.group(1)) - int(self._lastHeadIndex)) > 1:
+                raise Exception('last index ' + self._lastHeadIndex + 'current index: ' + n.group(1) )
+            self._lastHeadIndex = n.group(1)
 
-    def _parseHeadWords(self, node, passage ):
+    def _parseHeadWords(self, node, passage, senses = True ):
+        """ parses the head word of a passage and its senses under node; returns the head word (None if the passage has none).
+            if senses is not set then a _LazyHeadWord is returned instead, without its senses """
 
         #match = self._startHeadWordRe.match( passage )
         matchPos = passage.find('--')
         if matchPos != -1:
             try:
                 matchPos += 1
-                headDef = passage[ :matchPos ]
-                match = self._startHeadWordRe.match( headDef )
+                match = self._startHeadWordRe.match( passage, 0, matchPos )
                 if match:
-                    headWord = HeadWord( match.group(1), node )
+                    headWord = HeadWord( match.group(1), node ) if senses else _LazyHeadWord( match.group(1), node )
                     self._parseWord( headWord, match.group(3) )
 
                     if match.group(2) != None:
                         headWord._linkComment = match.group(2).strip()
 
                     matchPos += 1
-                    passage = passage[ matchPos: ]
 
                     self._headWordIndex[ headWord.index ] = headWord
 
-                    n = self._numRe.match( headWord.index )
-                    if n != None:
-                        if self._lastHeadIndex != None and (int(n.group(1)) - int(self._lastHeadIndex)) > 1:
-                            raise Exception('last index ' + self._lastHeadIndex + 'current index: ' + n.group(1) )
-                        self._lastHeadIndex = n.group(1)
+                    self._checkHeadIndex( headWord.index )
+
+                    if not senses:
+                        return headWord
 
                     #parse word groups
-                    groups = self._wordGroupBoundaryRe.findall( passage )
+                    groups = self._wordGroupBoundaryRe.findall( passage, matchPos )
                     for g in groups:
-                        gr = g[0].strip()
+                        gr = g.strip()
                         if gr =='':
                             continue
                         #print( '->', gr )
-                        wgroup = re.findall( self._wordBoundaryRe, gr )
+                        wgroup = self._wordBoundaryRe.findall( gr )
                         if  len(wgroup) > 1:
                             relatedWords = RogetNode( ROGET_NODE_SENSE_GROUP, None, headWord)
                             for wg in wgroup:
                                 w = Sense( ROGET_NODE_SENSE, relatedWords )
-                                self._parseWord( w, wg[0] )
+                                self._parseWord( w, wg )
                         else:
                             w  = Sense( ROGET_NODE_SENSE, headWord )
                             for wg in wgroup:
-                                self._parseWord( w, wg[0] )
+                                self._parseWord( w, wg )
 
                         #for w in wgroup:
                         #    print "\t\t$" , w[0] , "$"
 
+                    return headWord
+
             except Exception:
                 print('Error during pasing: ', passage)
                 raise
+        return None
+
+    def _countSenses(self, passage ):
+        """ returns the number of nodes that _parseHeadWords creates below the head word of the passage, without creating them """
+        count = 0
+        for g in self._wordGroupBoundaryRe.findall( passage, passage.find('--') + 2 ):
+            g = g.strip()
+            if g == '':
+                continue
+            words = len( self._wordBoundaryRe.findall( g ) )
+            # a group of several words has a node of its own
+            count += words + 1 if words > 1 else 1
+        return count
+
+    def _iterPassages(self, text ):
+        """ yields the match of each passage of the text up to the end of the thesaurus """
+        endPos = text.find('End of of E-Thesaurus')
+        if endPos == -1:
+            endPos = len(text)
+        for m in self._passageRe.finditer( text ):
+            if m.end() > endPos:
+                break
+            yield m
+
+    def _isHeadWordPassage(self, passage ):
+        """ True if _parseText parses the passage with _parseHeadWords (given that it is under a category) """
+        if self._passageTypeRe.match( passage ) != None:
+            return False
+        newLine = passage.find('\n')
+        return not ( ( newLine == -1 or newLine == len(passage) - 1 ) and not '--' in passage )
+
+    def _parseText(self, text, passages = None, lazy = None ):
+        """ builds the tree from the text in one pass over its passages; returns the root node.
+            if passages is a list then a tuple (hash of the passage, its head word or None) is appended for each passage.
+            if lazy is a _LazyText then the senses of the head words are not parsed, lazy records where their passages are """
+        root = RogetNode(ROGET_NODE_CATEGORY, 'root')
 
-    def parse(self):
+        currentNode = None
+        currentClass = None
+        currentDivision = None
+        currentSection = None
+        currentSubSection = None
+
+        passageType = self._passageTypeRe.match
+
+        for m in self._iterPassages( text ):
+            passage = m.group()
+            headWord = None
+            t = passageType( passage )
+            t = t.lastindex if t != None else None
+
+            if t == self._PASSAGE_CLASS or t == self._PASSAGE_DIVISION:
+                (description, _, key) = passage.partition('\n')
+                key = key.partition('\n')[0]
+                if t == self._PASSAGE_CLASS:
+                    currentNode = RogetNode( ROGET_NODE_CATEGORY, description, root )
+                    currentClass = currentNode
+                else:
+                    currentNode = RogetNode( ROGET_NODE_CATEGORY, description, currentClass )
+                currentNode._key = key.strip()
+                currentDivision = currentNode if t == self._PASSAGE_DIVISION else None
+                currentSection = None
+                currentSubSection = None
+
+            elif currentNode != None:
+                if t == self._PASSAGE_SECTION:
+                    (description, _, key) = passage.partition('\n')
+                    key = key.partition('\n')[0]
+                    if currentDivision != None:
+                        currentNode = RogetNode( ROGET_NODE_CATEGORY, description, currentDivision )
+                    else:
+                        currentNode = RogetNode( ROGET_NODE_CATEGORY, description, currentClass )
+                    currentNode._key = key.strip()
+                    currentSection = currentNode
+                    currentSubSection = None
+
+                elif t == self._PASSAGE_SUBSECTION:
+                    currentNode = RogetNode( ROGET_NODE_CATEGORY, None, currentSection )
+                    currentSubSection = currentNode
+                    currentNode._key = passage.partition('\n')[0].strip()
+                else:
+                    newLine = passage.find('\n')
+                    if ( newLine == -1 or newLine == len(passage) - 1 ) and not '--' in passage:
+                        if currentSubSection != None:
+                            currentNode = RogetNode( ROGET_NODE_CATEGORY, None, currentSubSection )
+                        else:
+                            currentNode = RogetNode( ROGET_NODE_CATEGORY, None, currentSection )
+                        currentNode._key = passage.strip()
+                    elif lazy != None:
+                        headWord = self._parseHeadWords( currentNode, passage, False )
+                        if headWord != None:
+                            lazy.add( headWord, m, self._countSenses( passage ) )
+                    else:
+                        headWord = self._parseHeadWords( currentNode, passage )
+
+            if passages != None:
+                passages.append( ( hash( passage ), headWord ) )
+
+        return root
+
+    def parse(self, normalizedIndex = False, fuzzyIndex = False, lazy = False):
         """
             parse the roget thesaursus
             returns an instance of RogetThesaurus
 
             Note that that file 10681-body.txt  must be in the same directory as the script roget.py
+
+            if normalizedIndex is set then the normalized index is built as well (see RogetThesaurus.lookupNormalized)
+            if fuzzyIndex is set then the index of RogetThesaurus.fuzzyLookup is built as well
+
+            a thesaurus that is not parsed lazily can be brought up to date with update after the text has changed
+
+            if lazy is set then only the categories and the head words are parsed, together with the byte offset
+            of the passage of each head word in the text; the senses of a head word are read from the text and
+            parsed on first access of its child nodes, and the sense index is built (by parsing all head words)
+            on first use. The tree and its internal ids are the same as those of a full parse. The text must
+            not change while the thesaurus is in use.
         """
-        
+        if self._VERBOSE != 0:
+            tm = time.time()
+
+        # a lazy thesaurus reads the passages by their byte offsets in the file, these are counted in the raw text
+        if lazy:
+            rawText = self._readText( True )
+            text = _universalNewlines( rawText )
+        else:
+            text = self._readText()
+
+        self._resetIndexes()
+        passages = None
+        senseIndex = self._senseIndex
+        with _pausedGC():
+            if lazy:
+                lazyText = _LazyText( self._textFile, self._headWordIndex, rawText )
+                root = self._parseText( text, lazy = lazyText )
+                # the raw text is only needed while the passages are added
+                lazyText._rawText = lazyText._crlf = None
+                self._resolveLazyReference( root )
+                senseIndex = _LazySenseIndex( root )
+            else:
+                passages = []
+                root = self._parseText( text, passages )
+                self._resolveReference( root )
+
+        if self._VERBOSE != 0:
+            tm = time.time() - tm
+            print("time to parse file: ", tm)
+
+        ret = RogetThesaurus(root,self._headWordIndex, senseIndex)
+        ret._passages = passages
+        self._resetIndexes()
+        if normalizedIndex:
+            ret.buildNormalizedIndex()
+        if fuzzyIndex:
+            ret.buildFuzzyIndex()
+        return ret
 
-        rpath = os.path.join(os.path.dirname(__file__), '10681-body.py' )
+    def _readText(self, raw = False ):
+        """ returns the text of the thesaurus, with the line ends translated to \\n (as by a file in text mode);
+            if raw is set then the line ends are kept as in the file """
+        rpath = self._textFile
         if os.access( rpath, os.F_OK | os.R_OK ) ==  0:
-            raise Exception("Roget thesaursus text file rpath has not been found")
+            raise Exception("Roget thesaursus text file " + rpath + " has not been found")
 
         if self._VERBOSE != 0:
             print("parsing file: ", rpath)
-            tm = time.time()
 
-        root = RogetNode(ROGET_NODE_CATEGORY, 'root')
-        classMatch = re.compile("^CLASS")
-        divisionMatch = re.compile("^DIVISION")
-        sectionMatch = re.compile("^SECTION")
-        subsectionMatch = re.compile(r"^[0-9]+\.? [A-Z][A-Z,\s]+")
+        with open( rpath, 'rb' ) as f:
+            text = f.read().decode()
+        return text if raw else _universalNewlines( text )
 
-        currentNode = None
-        currentClass = None
-        currentDivision = None
-        currentSection = None
-        currentSubSection = None
-
-        passage = ''
-        passageLines = 0
+    def update(self, roget ):
+        """
+            parses the text of the thesaurus again after it has changed; returns the RogetThesaurus with the changes
 
-        with open( rpath ) as f:
-            for line in f:
-                if line.strip() != '':
-                    passage += line
-                    passageLines += 1
-                elif line.strip() == '':
-                    if 'End of of E-Thesaurus' in passage:
-                        break
+            parse records the hash of each passage (a run of non blank lines) of the text and the head word that
+            the passage was parsed into. update only parses the head word passages with a different hash: roget is
+            changed in place - the senses of each of these head words are replaced, and only the links of the new
+            nodes are resolved (the head word nodes are kept, so that the links to them stay valid). roget itself
+            is returned.
 
-                    if classMatch.match( passage ):
-                        lines = passage.split('\n')
+            The whole text is parsed and a new RogetThesaurus is returned instead if roget was parsed lazily
+            (or was loaded from a snapshot), if passages were added or removed, if a passage that is
+            not a head word changed, or if a head word changed its index or its key.
 
-                        currentNode = RogetNode( ROGET_NODE_CATEGORY, lines[0], root )
-                        currentNode._key = lines[1].strip()
-                        currentClass = currentNode
-                        currentDivision = None
-                        currentSection = None
-                        currentSubSection = None
+            The data that is derived from the ontology of roget (arrays, similarity signatures, normalized,
+            prefix, fuzzy and token index) is dropped by an update that changes it, and is built again on first use.
+        """
+        state = roget._passages
+        if state == None:
+            return self.parse()
 
-                    elif divisionMatch.match( passage ):
-                        lines = passage.split( '\n' )
-                        currentNode = RogetNode( ROGET_NODE_CATEGORY, lines[0], currentClass )
-                        currentNode._key = lines[1].strip()
-                        currentDivision = currentNode
-                        currentSection = None
-                        currentSubSection = None
+        passages = [ m.group() for m in self._iterPassages( self._readText() ) ]
+        if len( passages ) != len( state ):
+            return self.parse()
 
-                    else:
-                        if currentNode != None:
-                            if sectionMatch.match( passage ):
-                                lines = passage.split( '\n' )
-
-
-                                if currentDivision != None:
-                                    currentNode = RogetNode( ROGET_NODE_CATEGORY, lines[0], currentDivision )
-                                else:
-                                    currentNode = RogetNode( ROGET_NODE_CATEGORY, lines[0], currentClass )
-                                currentNode._key = lines[1].strip()
-                                currentSection = currentNode
-                                currentSubSection = None
-
-                            elif subsectionMatch.match( passage ):
-                                lines = passage.split( '\n' )
-                                currentNode = RogetNode( ROGET_NODE_CATEGORY, None, currentSection )
-                                currentSubSection = currentNode
-                                currentNode._key = lines[0].strip()
-                            else:
-                                if passageLines == 1 and not '--' in passage:
-                                    if currentSubSection != None:
-                                        currentNode = RogetNode( ROGET_NODE_CATEGORY, None, currentSubSection )
-                                    else:
-                                        currentNode = RogetNode( ROGET_NODE_CATEGORY, None, currentSection )
-                                    currentNode._key = passage.strip()
-                                else:
-                                    self._parseHeadWords( currentNode, passage )
-                    passage = ''
-                    passageLines = 0
-
-        self._resolveReference( root )
+        # parse the changed passages under a detached node, so that roget is not changed unless all of them can be updated
+        changes = []
+        self._resetIndexes()
+        try:
+            detached = RogetNode( ROGET_NODE_CATEGORY, None )
+            for (passage, (passageHash, old)) in zip( passages, state ):
+                if hash( passage ) == passageHash:
+                    continue
+                if old == None or not self._isHeadWordPassage( passage ):
+                    return self.parse()
+                # the numbering of the head words is checked by the full parse only
+                self._lastHeadIndex = None
+                new = self._parseHeadWords( detached, passage )
+                if new == None or new._index != old._index or new._key != old._key:
+                    return self.parse()
+                changes.append( ( old, new ) )
+        finally:
+            self._resetIndexes()
+
+        headWordIndex = roget._headWordIndex
+        for (old, new) in changes:
+            for node in _iterPreorder( new ):
+                if node._type == ROGET_NODE_HEADWORD or node._type == ROGET_NODE_SENSE:
+                    if node._link != None and not node._link in headWordIndex:
+                        raise Exception("word: " + node._key   + " unresolved link: " + str( node._link ) )
 
         if self._VERBOSE != 0:
-            tm = time.time() - tm
-            print("time to parse file: ", tm)
+            print("changed head word passages: ", len( changes ))
+        if not changes:
+            return roget
+
+        with _pausedGC():
+            self._updateHeadWords( roget, changes )
+        roget._passages = [ ( hash( passage ), headWord ) for (passage, (_, headWord)) in zip( passages, state ) ]
+        roget._invalidate()
+        return roget
+
+    @staticmethod
+    def _adoptSenses( headWord, new, headWordIndex ):
+        """ makes headWord the parent of the senses of the head word new (that was parsed on its own) and resolves
+            their links; returns the list of these nodes in preorder. The caller sets headWord._child to new._child """
+        nodes = list( _iterPreorder( new ) )[ 1 : ]
+        for node in new._child:
+            node._parent = headWord
+        for node in nodes:
+            if node._type == ROGET_NODE_SENSE and node._link != None:
+                RogetBuilder._resolveLink( node, headWordIndex )
+        return nodes
+
+    @staticmethod
+    def _updateHeadWords( roget, changes ):
+        """ moves the fields and senses of each new head word to the old one; changes is a list of tuples (old head word, new head word) """
+        headWordIndex = roget._headWordIndex
+        senseIndex = roget._senseIndex
+
+        renumber = False
+        added = []
+        for (old, new) in changes:
+            oldNodes = list( _iterPreorder( old ) )[ 1 : ]
+            for node in oldNodes:
+                if node._type == ROGET_NODE_SENSE:
+                    senses = senseIndex[ node._key ]
+                    senses.remove( node )
+                    if not senses:
+                        del senseIndex[ node._key ]
+
+            old._description = new._description
+            old._comment = new._comment
+            old._linkComment = new._linkComment
+            old._wordType = new._wordType
+            old._link = headWordIndex[ new._link ] if new._link != None else None
+            newNodes = RogetBuilder._adoptSenses( old, new, headWordIndex )
+            old._child = new._child
+            if len( newNodes ) == len( oldNodes ):
+                # the new nodes take the internal ids of the old ones
+                for (node, internalId) in zip( newNodes, range( old._internalId + 1, old._internalId + 1 + len( newNodes ) ) ):
+                    node._internalId = internalId
+            else:
+                renumber = True
+            added.extend( newNodes )
+
+        if renumber:
+            internalId = 1
+            for node in _iterPreorder( roget._rootNode ):
+                node._internalId = internalId
+                internalId += 1
+
+        # the senses of a key are in preorder
+        for node in added:
+            if node._type == ROGET_NODE_SENSE:
+                senses = senseIndex.get( node._key )
+                if senses == None:
+                    senseIndex[ node._key ] = [ node ]
+                else:
+                    node._key = senses[0]._key
+                    pos = len( senses )
+                    while pos > 0 and senses[ pos - 1 ]._internalId > node._internalId:
+                        pos -= 1
+                    senses.insert( pos, node )
+
+    def getHeadWord(self, index, indexFile = None ):
+        """
+        returns the HeadWord with the given index (for example '124' or '20a') without parsing the whole text;
+        None if there is no such head word
 
-        return RogetThesaurus(root,self._headWordIndex, self._senseIndex)
+        The passage of the head word is read from the text by the offset index - the byte offset and the length
+        of the passage of each head word - that is stored in the file indexFile (the default is the name of the
+        text file with the extension .idx). The offset index is built (by a lazy parse, see parse) and stored
+        if the file does not exist or if it was built for a different version of the text.
 
-    def load(self, file ):
+        The head word has no parent; as with a lazy parse, its senses are parsed on first access of its child
+        nodes, and the head words that they link to are read on first use. The internal ids are those of a full parse.
+        """
+        if indexFile == None:
+            indexFile = os.path.splitext( self._textFile )[0] + '.idx'
+        textStat = os.stat( self._textFile )
+        version = ( indexFile, textStat.st_size, textStat.st_mtime_ns )
+
+        if self._headWordOffsets == None or self._headWordOffsets[0] != version:
+            offsets = None
+            if os.access( indexFile, os.F_OK | os.R_OK ):
+                try:
+                    offsets = _HeadWordOffsets.read( indexFile, self._textFile, textStat )
+                except Exception as e:
+                    print('Error while loading offset index', e)
+            if offsets == None:
+                offsets = _HeadWordOffsets.fromThesaurus( self._textFile, self.parse( lazy = True ) )
+                try:
+                    offsets.write( indexFile, textStat )
+                except Exception as e:
+                    print('Error while storing offset index', e)
+            self._headWordOffsets = ( version, offsets )
+
+        return self._headWordOffsets[1].get( index )
+
+    def load(self, file, mapped = False, normalizedIndex = False, fuzzyIndex = False ):
         """
-        loads an instance of roget thesaurus (if possible from pickled/serialized form)
+        loads an instance of roget thesaurus (if possible from its binary snapshot)
 
         if file does not exist
             parse roget thesaursus
-            store pickled form to file
+            store binary snapshot to file
         else
-            load pickled form from file
+            load binary snapshot from file
         returns instance of RogetThesaurus
 
-        don't use this! surprisingly it takes less time to parse it from the text file.
-        (even with this inefficient parser)
+        The snapshot is a versioned binary file: a table of all strings, the nodes of the
+        ontology stored column by column (type, parent, key, link, word type, comment...)
+        and the prebuilt head word and sense indexes. Loading it takes about half the time of parsing
+        the text (0.2 seconds against 0.45 seconds): most of that time goes to creating the objects of
+        all nodes. A snapshot with a different format version is parsed again and overwritten.
 
-        Reason for this seems to be that pickled format is much larger then text file;
-        pickle adds the type of the class as first element of sexpression -
-        so there is a lot of redundancy and pickled file is much larger than text file.
+        if mapped is set then the snapshot is memory mapped instead of being read: the indexes and
+        the nodes of the returned RogetThesaurus are thin views that are created on demand from the
+        mapped file, so that all processes that load the same file share one copy of the data.
+        This load takes less than a millisecond; use it where the start up time matters.
+
+        if normalizedIndex is set then the normalized index is built as well (see RogetThesaurus.lookupNormalized)
+        if fuzzyIndex is set then the index of RogetThesaurus.fuzzyLookup is built as well
         """
         res = None
         if os.access( file, os.F_OK | os.R_OK ):
-            print('file exists: ', file)
-            res = self._loadFromFile( file )
+            res = self._loadFromFile( file, mapped )
 
         if res == None:
-            print('load from file; current recursion limit ', sys.getrecursionlimit())
-
             if self._VERBOSE != 0:
                 print("Parsing from text: ", file)
                 tm = time.time()
@@ -335,26 +781,41 @@ class RogetBuilder:
                 tm = time.time() - tm
                 print("time to parse from text: ", tm)
             self._storeToFile( file, res )
-
+            if mapped:
+                # (this may be the snapshot of another process that has replaced file in the meantime)
+                mappedRes = self._loadFromFile( file, mapped )
+                if mappedRes != None:
+                    res = mappedRes
+
+        if normalizedIndex:
+            res.buildNormalizedIndex()
+        if fuzzyIndex:
+            res.buildFuzzyIndex()
         return res
 
-    def _loadFromFile( self, file ):
+    def store(self, roget, file ):
+        """
+        stores an instance of RogetThesaurus as binary snapshot to file; the snapshot can be loaded with load.
+        The snapshot is written to a temporary file that then replaces file, so that processes that have
+        mapped the previous snapshot of file keep their copy of it.
+        """
+        with _replacedFile( file ) as f:
+            self._writeSnapshot( f, roget )
+
+    def _loadFromFile( self, file, mapped = False ):
         try:
-            #r = RogetThesaurus()
             if self._VERBOSE != 0:
                 print("Load from file: ", file)
                 tm = time.time()
-            curRecursionLimit = sys.getrecursionlimit()
-            if curRecursionLimit < self._RECURSION_LIMIT:
-                sys.setrecursionlimit( self._RECURSION_LIMIT )
-            with open( file ) as f:
-                ret = pickle.load( f )
-                if curRecursionLimit < self._RECURSION_LIMIT:
-                    sys.setrecursionlimit( curRecursionLimit )
-                if self._VERBOSE != 0:
-                    tm = time.time() - tm
+            if mapped:
+                ret = _SnapshotMap( file ).thesaurus()
+            else:
+                with open( file, 'rb' ) as f:
+                    ret = self._readSnapshot( f.read() )
+            if self._VERBOSE != 0:
+                tm = time.time() - tm
                 print("time to load from file: ", tm)
-                return ret
+            return ret
         except Exception as e:
             print('Error while loading thesaurus', e)
             return None
@@ -364,46 +825,254 @@ class RogetBuilder:
             if self._VERBOSE != 0:
                 print("Storing to file: ", file)
                 tm = time.time()
-            curRecursionLimit = sys.getrecursionlimit()
-            if curRecursionLimit < self._RECURSION_LIMIT:
-                sys.setrecursionlimit( self._RECURSION_LIMIT )
-            print('storing to ' +  file)
-            with open( file, 'w') as f:
-                pickle.dump( r, f )
-            if curRecursionLimit < self._RECURSION_LIMIT:
-                sys.setrecursionlimit( curRecursionLimit )
+            self.store( r, file )
             if self._VERBOSE != 0:
                 tm = time.time() - tm
                 print("time to store to file: ", tm)
         except Exception as e:
             print('Error while storing thesaurus', e)
-            os.remove( file )
             return None
 
+    @staticmethod
+    def _snapshotLayout( header ):
+        """ returns list of (name, typecode, offset, count) for each section of a snapshot with the given header """
+        (magic, version, nodeCount, stringCount, blobSize, headWordCount, senseKeyCount, postingCount) = header
+        if magic != _SNAPSHOT_MAGIC:
+            raise Exception("not a roget thesaurus snapshot")
+        if version != _SNAPSHOT_VERSION:
+            raise Exception("unsupported snapshot version: " + str(version))
+
+        sections = [ ('stringOffsets', 'I', stringCount + 1), ('stringBlob', 'B', blobSize) ]
+        for (name, typecode) in _SNAPSHOT_COLUMNS:
+            sections.append( (name, typecode, nodeCount) )
+        sections += [ ('headWordKey', 'i', headWordCount), ('headWordNode', 'i', headWordCount),
+                      ('senseKey', 'i', senseKeyCount), ('senseStart', 'i', senseKeyCount + 1), ('sensePosting', 'i', postingCount),
+                      ('senseHash', 'i', _hashTableSize( senseKeyCount )) ]
+
+        ret = []
+        offset = _SNAPSHOT_HEADER.size
+        for (name, typecode, count) in sections:
+            ret.append( (name, typecode, offset, count) )
+            offset += count * array(typecode).itemsize
+            offset = (offset + 7) & ~7
+        return ret
+
+    def _writeSnapshot( self, f, r ):
+        nodes = list( _iterPreorder( r.rootNode ) )
+        nodeIdx = {}
+        for (i, n) in enumerate(nodes):
+            nodeIdx[ n ] = i
+
+        # string table, sorted so that the sense index section is sorted by key as well
+        strings = set()
+        for n in nodes:
+            strings.add( n._key )
+            if n._description != None:
+                strings.add( n._description )
+            if n._type == ROGET_NODE_HEADWORD or n._type == ROGET_NODE_SENSE:
+                strings.add( n._comment )
+                if n._linkComment != None:
+                    strings.add( n._linkComment )
+                if n._type == ROGET_NODE_HEADWORD:
+                    strings.add( n._index )
+        strings = sorted( strings )
+        stringIdx = {}
+        for (i, s) in enumerate(strings):
+            stringIdx[ s ] = i
+        blob = ( '\0'.join( strings ) + '\0' ).encode('utf-8')
+        stringOffsets = array('I', [0])
+        pos = 0
+        for s in strings:
+            pos += len( s.encode('utf-8') ) + 1
+            stringOffsets.append( pos )
+
+        columns = {}
+        for (name, typecode) in _SNAPSHOT_COLUMNS:
+            columns[ name ] = array( typecode, [0 if typecode == 'B' else -1] ) * len(nodes)
+
+        for (i, n) in enumerate(nodes):
+            columns['type'][i] = n._type
+            if n._parent != None:
+                columns['parent'][i] = nodeIdx[ n._parent ]
+            if n._child:
+                columns['firstChild'][i] = nodeIdx[ n._child[0] ]
+                prev = None
+                for c in n._child:
+                    if prev != None:
+                        columns['nextSibling'][ prev ] = nodeIdx[ c ]
+                    prev = nodeIdx[ c ]
+            columns['key'][i] = stringIdx[ n._key ]
+            if n._description != None:
+                columns['description'][i] = stringIdx[ n._description ]
+            if n._type == ROGET_NODE_HEADWORD or n._type == ROGET_NODE_SENSE:
+                columns['wordType'][i] = n._wordType
+                columns['comment'][i] = stringIdx[ n._comment ]
+                if n._link != None:
+                    columns['link'][i] = nodeIdx[ n._link ]
+                if n._linkComment != None:
+                    columns['linkComment'][i] = stringIdx[ n._linkComment ]
+                if n._type == ROGET_NODE_HEADWORD:
+                    columns['index'][i] = stringIdx[ n._index ]
+
+        headWordKey = array('i')
+        headWordNode = array('i')
+        for key in sorted( r.headWordIndex ):
+            headWordKey.append( stringIdx[ key ] )
+            headWordNode.append( nodeIdx[ r.headWordIndex[ key ] ] )
+
+        senseKey = array('i')
+        senseStart = array('i', [0])
+        sensePosting = array('i')
+        for key in sorted( r.senseIndex ):
+            senseKey.append( stringIdx[ key ] )
+            for n in r.senseIndex[ key ]:
+                sensePosting.append( nodeIdx[ n ] )
+            senseStart.append( len( sensePosting ) )
+
+        # open addressing hash table from the key to its position in senseKey (for lookups in a mapped snapshot)
+        senseHash = array('i', [-1]) * _hashTableSize( len(senseKey) )
+        mask = len(senseHash) - 1
+        for (pos, key) in enumerate(senseKey):
+            slot = _stringHash( strings[ key ].encode('utf-8') ) & mask
+            while senseHash[ slot ] != -1:
+                slot = ( slot + 1 ) & mask
+            senseHash[ slot ] = pos
+
+        header = ( _SNAPSHOT_MAGIC, _SNAPSHOT_VERSION, len(nodes), len(strings), len(blob),
+                   len(headWordKey), len(senseKey), len(sensePosting) )
+        sections = { 'stringOffsets' : stringOffsets, 'stringBlob' : blob,
+                     'headWordKey' : headWordKey, 'headWordNode' : headWordNode,
+                     'senseKey' : senseKey, 'senseStart' : senseStart, 'sensePosting' : sensePosting, 'senseHash' : senseHash }
+        sections.update( columns )
+
+        f.write( _SNAPSHOT_HEADER.pack( *header ) )
+        pos = _SNAPSHOT_HEADER.size
+        for (name, typecode, offset, count) in self._snapshotLayout( header ):
+            f.write( b'\0' * (offset - pos) )
+            data = sections[ name ]
+            if isinstance( data, array ):
+                if sys.byteorder != 'little':
+                    data = array( typecode, data )
+                    data.byteswap()
+                data = data.tobytes()
+            f.write( data )
+            pos = offset + len(data)
+
+    def _readSnapshot( self, buf ):
+        header = _SNAPSHOT_HEADER.unpack_from( buf, 0 )
+        sections = {}
+        for (name, typecode, offset, count) in self._snapshotLayout( header ):
+            size = count * array(typecode).itemsize
+            if offset + size > len(buf):
+                raise Exception("truncated snapshot")
+            if name == 'stringBlob':
+                sections[ name ] = buf[ offset : offset + size ]
+            else:
+                col = array( typecode )
+                col.frombytes( buf[ offset : offset + size ] )
+                if sys.byteorder != 'little':
+                    col.byteswap()
+                sections[ name ] = col
+
+        strings = sections['stringBlob'].decode('utf-8').split('\0')
+        strings[ -1 ] = None # the trailing separator leaves an empty entry; string id -1 stands for None
+
+        string = strings.__getitem__
+        nodeCount = len( sections['type'] )
+
+        # nodes are created without calling the constructors (like pickle does)
+        with _pausedGC():
+            childLists = [ [] if c != -1 else _NO_CHILDREN for c in sections['firstChild'] ]
+            new = object.__new__
+            nodes = []
+            append = nodes.append
+            for (i, typ, wordType, parent, key, description, comment, linkComment, index, child) in zip(
+                    range( 1, nodeCount + 1 ), sections['type'], sections['wordType'], sections['parent'],
+                    map( string, sections['key'] ), map( string, sections['description'] ), map( string, sections['comment'] ),
+                    map( string, sections['linkComment'] ), map( string, sections['index'] ), childLists ):
+                if parent != -1:
+                    siblings = childLists[ parent ]
+                    parent = nodes[ parent ]
+                else:
+                    siblings = None
+                    parent = None
+                if typ == ROGET_NODE_SENSE or typ == ROGET_NODE_HEADWORD:
+                    if typ == ROGET_NODE_SENSE:
+                        n = new( Sense )
+                    else:
+                        n = new( HeadWord )
+                    n._type = typ
+                    n._description = description
+                    n._parent = parent
+                    n._child = child
+                    n._key = key
+                    n._internalId = i
+                    n._comment = comment
+                    n._link = None
+                    n._linkComment = linkComment
+                    n._wordType = wordType
+                    if typ == ROGET_NODE_HEADWORD:
+                        n._index = index
+                else:
+                    n = new( RogetNode )
+                    n._type = typ
+                    n._description = description
+                    n._parent = parent
+                    n._child = child
+                    n._key = key
+                    n._internalId = i
+                append( n )
+                if siblings != None:
+                    siblings.append( n )
+
+            node = nodes.__getitem__
+
+            for (n, l) in zip( nodes, sections['link'] ):
+                if l != -1:
+                    n._link = nodes[ l ]
+
+            headWordIndex = dict( zip( map( string, sections['headWordKey'] ), map( node, sections['headWordNode'] ) ) )
+
+            senseIndex = {}
+            senseStart = sections['senseStart']
+            sensePosting = list( map( node, sections['sensePosting'] ) )
+            for (k, start, end) in zip( map( string, sections['senseKey'] ), senseStart, senseStart[1:] ):
+                senseIndex[ k ] = sensePosting[ start : end ]
+
+        ret = RogetThesaurus( nodes[0], headWordIndex, senseIndex )
+        # the sense keys of the snapshot are sorted
+        ret._prefixIndex = list( senseIndex )
+        # the snapshot already has the node columns
+        ret._arrays = RogetThesaurusArrays( sections['type'], sections['wordType'], sections['parent'], sections['firstChild'],
+                                            sections['nextSibling'], sections['link'], sections['key'], strings, node )
+        return ret
+
 
 class RogetNode:
     """
         RogetNode - the base class of all nodes maintained by Roget thesaurus
     """
-    def __init__(self, typ, description, parent = None):
-        global _lastInternalId
+    __slots__ = ( '_type', '_description', '_parent', '_child', '_key', '_internalId' )
 
+    def __init__(self, typ, description, parent = None):
         self._type = typ
         if description != None:
             self._description = description.strip()
         else:
             self._description = None
         self._parent = parent
-        self._child = []
+        self._child = _NO_CHILDREN
         self._key = ''
-        self._internalId = _lastInternalId
-        _lastInternalId += 1
+        self._internalId = 0
         if parent != None:
             parent._addChild( self )
             #print("addChild ", description, "parent ",parent.description)
 
     def _addChild(self, nchild):
-        self._child.append( nchild )
+        if self._child:
+            self._child.append( nchild )
+        else:
+            self._child = [ nchild ]
 
     def toString(self):
         ret = self.typeToString()
@@ -414,14 +1083,7 @@ class RogetNode:
 
     def typeToString(self):
         """ returns the type o this node as a string """
-        if self._type == ROGET_NODE_CATEGORY:
-            return "Category"
-        elif self._type == ROGET_NODE_HEADWORD:
-            return "Headword"
-        elif self._type == ROGET_NODE_SENSE_GROUP:
-            return "SenseGroup"
-        elif self._type == ROGET_NODE_SENSE:
-            return "Sense"
+        return _NODE_TYPE_NAMES.get( self._type )
 
     @property
     def type(self):
@@ -445,12 +1107,12 @@ class RogetNode:
 
     @property
     def child(self):
-        """ returns the array of child nodes """
+        """ returns the array of child nodes (an empty tuple for leaf nodes) """
         return self._child
 
     @property
     def internalId(self):
-        """ each node has its own internal id """
+        """ each node has its own internal id; the nodes of a tree are numbered in preorder, starting with 1 at the root """
         return self._internalId
 
 
@@ -459,6 +1121,7 @@ class Sense(RogetNode):
     """
         a single sense (the leaf node of the Roget Thesaurus
     """
+    __slots__ = ( '_comment', '_link', '_linkComment', '_wordType' )
 
 
     #def __init__(self, parent):
@@ -475,28 +1138,18 @@ class Sense(RogetNode):
         return self._wordToString()
 
     def _wordToString(self):
-        ret = self.typeToString() + " ("  + self.key + ")"
+        parts = [ _NODE_TYPE_NAMES.get( self._type ), " (", self._key, ")" ]
         if self._wordType != WORD_TYPE_NONE:
-            ret += ' /'
-            if self._wordType ==  WORD_TYPE_ADJ:
-                ret += 'Adj'
-            if self._wordType ==  WORD_TYPE_VERB:
-                ret += 'V'
-            if self._wordType ==  WORD_TYPE_ADVERB:
-                ret += 'Adv'
-            if self._wordType ==  WORD_TYPE_NOUN:
-                ret += 'N'
-            if self._wordType ==  WORD_TYPE_PHRASE:
-                ret += 'Phr'
-            ret += '/ '
-        if self.comment != '':
-            ret += ' comment: ' + self.comment
-        if self.link != None:
-            ret += " [link: #" + self.link.index
-            if self.link.key != None:
-                ret += " (" + self.link.key + ")"
-            ret += " ]"
-        return ret
+            parts.append( ' /' + _WORD_TYPE_NAMES.get( self._wordType, '' ) + '/ ' )
+        if self._comment != '':
+            parts += ( ' comment: ', self._comment )
+        link = self._link
+        if link != None:
+            parts += ( " [link: #", link._index )
+            if link._key != None:
+                parts += ( " (", link._key, ")" )
+            parts.append( " ]" )
+        return ''.join( parts )
 
     @property
     def comment(self):
@@ -525,6 +1178,7 @@ class HeadWord(Sense):
     """
         A headword
     """
+    __slots__ = ( '_index', )
     def __init__(self, HeadIndex, parent):
         Sense.__init__( self, ROGET_NODE_HEADWORD, parent)
         self._index = HeadIndex.strip()
@@ -537,6 +1191,980 @@ class HeadWord(Sense):
         """ the string id that identifies the headword in the Roget thesaurus """
         return self._index
 
+class _LazyHeadWord(HeadWord):
+    """
+        a head word of a lazily parsed thesaurus; its senses are parsed on first use of _child (see _LazyText)
+    """
+    __slots__ = ( '_lazy', )
+
+    def __init__(self, HeadIndex, parent):
+        HeadWord.__init__( self, HeadIndex, parent )
+        self._lazy = None
+
+    def __getattr__(self, name ):
+        # only called for the unset slot _child
+        if name != '_child':
+            raise AttributeError( name )
+        lazy = self._lazy
+        if lazy != None:
+            lazy[0].load( self )
+        # set by load (here or in another thread)
+        return self._child
+
+class _LazyText:
+    """
+        the text of a lazily parsed thesaurus: the byte offset and the length of the passage of each head word;
+        parses the senses of a head word on first use
+    """
+    def __init__(self, textFile, headWordIndex, rawText = None ):
+        """ rawText is the text with the line ends of the file, if the passages are added (see add) """
+        self._textFile = textFile
+        self._headWordIndex = headWordIndex
+        self._builder = RogetBuilder( textFile = textFile )
+        self._lock = threading.Lock()
+        self._rawText = rawText
+        # the positions in the parsed text of the line ends that are \r\n in the file (as a line end is one
+        # character in the parsed text, the position of the passages in the raw text is found by bisection)
+        self._crlf = None
+        if rawText != None and '\r\n' in rawText:
+            self._crlf = [ m.start() - i for (i, m) in enumerate( re.finditer( '\r\n', rawText ) ) ]
+        self._charPos = 0
+        self._bytePos = 0
+
+    def add(self, headWord, m, count ):
+        """ records the passage of headWord (m is its match in the text) and count, the number of nodes below the head word;
+            the passages are added in the order of the text """
+        text = m.string
+        start = m.start()
+        end = m.end()
+        if self._crlf != None:
+            text = self._rawText
+            start += bisect.bisect_left( self._crlf, start )
+            end += bisect.bisect_left( self._crlf, end )
+        self._bytePos += len( text[ self._charPos : start ].encode() )
+        self._charPos = start
+        self.setPassage( headWord, self._bytePos, len( text[ start : end ].encode() ), count )
+
+    def setPassage(self, headWord, offset, length, count ):
+        """ the senses of headWord are parsed from the passage at offset on first use """
+        headWord._lazy = ( self, offset, length, count )
+        del headWord._child
+
+    def load(self, headWord ):
+        """ parses the senses of headWord; their internal ids follow the one of the head word, as in a full parse """
+        with self._lock:
+            if headWord._lazy == None:
+                # loaded by another thread
+                return
+            (_, offset, length, count) = headWord._lazy
+            with open( self._textFile, 'rb' ) as f:
+                f.seek( offset )
+                passage = _universalNewlines( f.read( length ).decode() )
+
+            self._builder._resetIndexes()
+            new = self._builder._parseHeadWords( RogetNode( ROGET_NODE_CATEGORY, None ), passage )
+            if new == None or new._index != headWord._index:
+                raise Exception("the text of the thesaurus has changed: " + self._textFile )
+            nodes = RogetBuilder._adoptSenses( headWord, new, self._headWordIndex )
+            if len( nodes ) != count:
+                raise Exception("the text of the thesaurus has changed: " + self._textFile )
+            internalId = headWord._internalId
+            for node in nodes:
+                internalId += 1
+                node._internalId = internalId
+
+            # the nodes are complete before they become visible to other threads
+            headWord._child = new._child
+            headWord._lazy = None
+
+class _LazySenseIndex(Mapping):
+    """
+        the sense index of a lazily parsed thesaurus; it is built on first use, this parses all head words
+    """
+    def __init__(self, root ):
+        self._root = root
+        self._index = None
+
+    def _senses(self):
+        if self._index == None:
+            index = {}
+            with _pausedGC():
+                for node in _iterPreorder( self._root ):
+                    if node._type == ROGET_NODE_HEADWORD or node._type == ROGET_NODE_SENSE:
+                        senses = index.get( node._key )
+                        if senses == None:
+                            index[ node._key ] = [ node ]
+                        else:
+                            node._key = senses[0]._key
+                            senses.append( node )
+            self._index = index
+        return self._index
+
+    def __getitem__(self, key ):
+        return self._senses()[ key ]
+
+    def get(self, key, default = None ):
+        return self._senses().get( key, default )
+
+    def __contains__(self, key ):
+        return key in self._senses()
+
+    def __iter__(self):
+        return iter( self._senses() )
+
+    def __len__(self):
+        return len( self._senses() )
+
+class _HeadWordOffsets(Mapping):
+    """
+        the offset index of the head words of a text (see RogetBuilder.getHeadWord): the byte offset and the length
+        of the passage, the internal id and the number of nodes below each head word. Maps the index of a head word
+        to a _LazyHeadWord that is read from its passage on first use
+    """
+    def __init__(self, textFile, indexes, columns ):
+        self._textFile = textFile
+        self._indexes = indexes
+        self._positions = { index : i for (i, index) in enumerate( indexes ) }
+        self._columns = columns
+        self._lazyText = _LazyText( textFile, self )
+        self._builder = RogetBuilder( textFile = textFile )
+        # linked head words are read while the lock is held
+        self._lock = threading.RLock()
+        self._headWords = {}
+
+    @staticmethod
+    def fromThesaurus( textFile, roget ):
+        """ the offset index of a thesaurus that was just parsed lazily from textFile """
+        headWords = sorted( roget.headWordIndex.values(), key = lambda headWord: headWord._internalId )
+        columns = {}
+        columns['offset'] = array( 'q', [ headWord._lazy[1] for headWord in headWords ] )
+        columns['length'] = array( 'i', [ headWord._lazy[2] for headWord in headWords ] )
+        columns['internalId'] = array( 'i', [ headWord._internalId for headWord in headWords ] )
+        columns['count'] = array( 'i', [ headWord._lazy[3] for headWord in headWords ] )
+        return _HeadWordOffsets( textFile, [ headWord._index for headWord in headWords ], columns )
+
+    @staticmethod
+    def read( file, textFile, textStat ):
+        """ reads the offset index from file; None if it was built for a different version of textFile.
+            raises an exception if the file is not a complete offset index """
+        with open( file, 'rb' ) as f:
+            buf = f.read()
+        (magic, version, count, textSize, textTime, blobSize) = _OFFSET_INDEX_HEADER.unpack_from( buf, 0 )
+        if magic != _OFFSET_INDEX_MAGIC:
+            raise Exception("not an offset index of the roget thesaurus")
+        if version != _OFFSET_INDEX_VERSION or textSize != textStat.st_size or textTime != textStat.st_mtime_ns:
+            return None
+        pos = _OFFSET_INDEX_HEADER.size
+        if len( buf ) != pos + sum( count * array( typecode ).itemsize for (_, typecode) in _OFFSET_INDEX_COLUMNS ) + blobSize:
+            raise Exception("the offset index is truncated or has a wrong size")
+        columns = {}
+        for (name, typecode) in _OFFSET_INDEX_COLUMNS:
+            col = array( typecode )
+            size = count * col.itemsize
+            col.frombytes( buf[ pos : pos + size ] )
+            columns[ name ] = col
+            pos += size
+        indexes = buf[ pos : pos + blobSize ].decode().split('\n')
+        if len( indexes ) != count:
+            raise Exception("the offset index does not have the expected number of head words")
+        return _HeadWordOffsets( textFile, indexes, columns )
+
+    def write(self, file, textStat ):
+        """ writes the offset index to file; textStat is the result of os.stat of the text that it was built from.
+            the index is written to a temporary file that then replaces file, so that a reader never sees a partial index """
+        blob = '\n'.join( self._indexes ).encode()
+        with _replacedFile( file ) as f:
+            f.write( _OFFSET_INDEX_HEADER.pack( _OFFSET_INDEX_MAGIC, _OFFSET_INDEX_VERSION, len( self._indexes ),
+                                                textStat.st_size, textStat.st_mtime_ns, len( blob ) ) )
+            for (name, _) in _OFFSET_INDEX_COLUMNS:
+                f.write( self._columns[ name ].tobytes() )
+            f.write( blob )
+
+    def _headWord(self, pos ):
+        """ reads the head word at position pos of the index, without its senses """
+        index = self._indexes[ pos ]
+        with self._lock:
+            headWord = self._headWords.get( index )
+            if headWord != None:
+                return headWord
+            offset = self._columns['offset'][ pos ]
+            length = self._columns['length'][ pos ]
+            with open( self._textFile, 'rb' ) as f:
+                f.seek( offset )
+                passage = _universalNewlines( f.read( length ).decode() )
+
+            self._builder._resetIndexes()
+            headWord = self._builder._parseHeadWords( None, passage, False )
+            if headWord == None or headWord._index != index:
+                raise Exception("the text of the thesaurus has changed: " + self._textFile )
+            headWord._internalId = self._columns['internalId'][ pos ]
+            self._lazyText.setPassage( headWord, offset, length, self._columns['count'][ pos ] )
+            # before the link is read, in case that it links back
+            self._headWords[ index ] = headWord
+
+            link = headWord._link
+            if link != None:
+                link = self[ link ]
+                headWord._link = link
+                if headWord._key == '':
+                    headWord._key = link._key
+            return headWord
+
+    def __getitem__(self, index ):
+        pos = self._positions.get( index )
+        if pos == None:
+            raise KeyError( index )
+        return self._headWord( pos )
+
+    def get(self, index, default = None ):
+        pos = self._positions.get( index )
+        if pos == None:
+            return default
+        return self._headWord( pos )
+
+    def __contains__(self, index ):
+        return index in self._positions
+
+    def __iter__(self):
+        return iter( self._indexes )
+
+    def __len__(self):
+        return len( self._indexes )
+
+class _SnapshotMap:
+    """
+        a memory mapped binary snapshot; the columns of the snapshot are accessed in place
+    """
+    def __init__(self, file):
+        if sys.byteorder != 'little':
+            raise Exception("memory mapped snapshots require a little endian machine")
+        with open( file, 'rb' ) as f:
+            self._mmap = mmap.mmap( f.fileno(), 0, access = mmap.ACCESS_READ )
+        buf = memoryview( self._mmap )
+
+        header = _SNAPSHOT_HEADER.unpack_from( buf, 0 )
+        self._sections = {}
+        for (name, typecode, offset, count) in RogetBuilder._snapshotLayout( header ):
+            size = count * array(typecode).itemsize
+            if offset + size > len(buf):
+                raise Exception("truncated snapshot")
+            self._sections[ name ] = buf[ offset : offset + size ].cast( typecode )
+
+        self._stringOffsets = self._sections['stringOffsets']
+        self._stringBlob = self._sections['stringBlob']
+        self._types = self._sections['type']
+        self._wordTypes = self._sections['wordType']
+        self._parents = self._sections['parent']
+        self._firstChild = self._sections['firstChild']
+        self._nextSibling = self._sections['nextSibling']
+        self._keys = self._sections['key']
+        self._descriptions = self._sections['description']
+        self._comments = self._sections['comment']
+        self._links = self._sections['link']
+        self._linkComments = self._sections['linkComment']
+        self._indexes = self._sections['index']
+
+    def thesaurus(self):
+        ret = RogetThesaurus( self.node( 0 ), _MappedHeadWordIndex( self ), _MappedSenseIndex( self ) )
+        ret._arrays = RogetThesaurusArrays( self._types, self._wordTypes, self._parents, self._firstChild, self._nextSibling,
+                                            self._links, self._keys, _SnapshotStringTable( self ), self.node )
+        ret._prefixIndex = _SnapshotSenseKeys( self )
+        return ret
+
+    def string(self, i):
+        if i == -1:
+            return None
+        return self._stringBlob[ self._stringOffsets[i] : self._stringOffsets[i+1] - 1 ].tobytes().decode('utf-8')
+
+    def stringId(self, s):
+        """ returns id of string in the (sorted) string table or -1 """
+        s = s.encode('utf-8')
+        pos = bisect.bisect_left( _SnapshotStrings( self ), s )
+        if pos < len( self._stringOffsets ) - 1 and self._stringBytes( pos ) == s:
+            return pos
+        return -1
+
+    def _stringBytes(self, i):
+        return self._stringBlob[ self._stringOffsets[i] : self._stringOffsets[i+1] - 1 ].tobytes()
+
+    def node(self, i):
+        if i == -1:
+            return None
+        typ = self._types[i]
+        if typ == ROGET_NODE_SENSE:
+            return _MappedSense( self, i )
+        if typ == ROGET_NODE_HEADWORD:
+            return _MappedHeadWord( self, i )
+        return _MappedCategory( self, i )
+
+class _SnapshotStrings:
+    """ the string table of a mapped snapshot as sequence of utf-8 strings (for bisect) """
+    def __init__(self, smap):
+        self._smap = smap
+
+    def __len__(self):
+        return len( self._smap._stringOffsets ) - 1
+
+    def __getitem__(self, i):
+        return self._smap._stringBytes( i )
+
+class _SnapshotStringTable(_SnapshotStrings):
+    """ the string table of a mapped snapshot as sequence of strings """
+    def __getitem__(self, i):
+        return self._smap.string( i )
+
+class _SnapshotSenseKeys:
+    """ the (sorted) keys of the sense index of a mapped snapshot as sequence of strings (for bisect) """
+    def __init__(self, smap):
+        self._smap = smap
+        self._keys = smap._sections['senseKey']
+
+    def __len__(self):
+        return len( self._keys )
+
+    def __getitem__(self, i):
+        return self._smap.string( self._keys[i] )
+
+class _MappedNodeView:
+    """
+        mixin that implements the node properties by looking up the columns of a mapped snapshot;
+        views are created on demand; two views are equal if they refer to the same node.
+    """
+    __slots__ = ()
+    def __init__(self, smap, idx):
+        self._smap = smap
+        self._idx = idx
+
+    def __eq__(self, other):
+        return isinstance( other, _MappedNodeView ) and other._idx == self._idx and other._smap is self._smap
+
+    def __ne__(self, other):
+        return not self.__eq__( other )
+
+    def __hash__(self):
+        return self._idx
+
+    @property
+    def _type(self):
+        return self._smap._types[ self._idx ]
+
+    @property
+    def _key(self):
+        return self._smap.string( self._smap._keys[ self._idx ] )
+
+    @property
+    def _description(self):
+        return self._smap.string( self._smap._descriptions[ self._idx ] )
+
+    @property
+    def _parent(self):
+        return self._smap.node( self._smap._parents[ self._idx ] )
+
+    @property
+    def _child(self):
+        smap = self._smap
+        ret = []
+        c = smap._firstChild[ self._idx ]
+        while c != -1:
+            ret.append( smap.node( c ) )
+            c = smap._nextSibling[ c ]
+        return ret
+
+    @property
+    def _internalId(self):
+        return self._idx + 1
+
+    @property
+    def _comment(self):
+        return self._smap.string( self._smap._comments[ self._idx ] )
+
+    @property
+    def _link(self):
+        return self._smap.node( self._smap._links[ self._idx ] )
+
+    @property
+    def _linkComment(self):
+        return self._smap.string( self._smap._linkComments[ self._idx ] )
+
+    @property
+    def _wordType(self):
+        return self._smap._wordTypes[ self._idx ]
+
+    @property
+    def _index(self):
+        return self._smap.string( self._smap._indexes[ self._idx ] )
+
+class _MappedCategory(_MappedNodeView, RogetNode):
+    __slots__ = ( '_smap', '_idx' )
+
+class _MappedSense(_MappedNodeView, Sense):
+    __slots__ = ( '_smap', '_idx' )
+
+class _MappedHeadWord(_MappedNodeView, HeadWord):
+    __slots__ = ( '_smap', '_idx' )
+
+class _MappedHeadWordIndex(Mapping):
+    """ headWordIndex of a mapped snapshot; maps the head word index to a view of the HeadWord node """
+    def __init__(self, smap):
+        self._smap = smap
+        self._keys = smap._sections['headWordKey']
+        self._nodes = smap._sections['headWordNode']
+
+    def _find(self, key):
+        if not isinstance( key, str ):
+            return -1
+        sid = self._smap.stringId( key )
+        if sid == -1:
+            return -1
+        pos = bisect.bisect_left( self._keys, sid )
+        if pos < len( self._keys ) and self._keys[ pos ] == sid:
+            return pos
+        return -1
+
+    def __getitem__(self, key):
+        pos = self._find( key )
+        if pos == -1:
+            raise KeyError( key )
+        return self._smap.node( self._nodes[ pos ] )
+
+    def __contains__(self, key):
+        return self._find( key ) != -1
+
+    def get(self, key, default = None):
+        pos = self._find( key )
+        if pos == -1:
+            return default
+        return self._smap.node( self._nodes[ pos ] )
+
+    def __len__(self):
+        return len( self._keys )
+
+    def __iter__(self):
+        for sid in self._keys:
+            yield self._smap.string( sid )
+
+class _MappedSenseIndex(_MappedHeadWordIndex):
+    """ senseIndex of a mapped snapshot; maps the word sense to a list of views of its nodes """
+    def __init__(self, smap):
+        self._smap = smap
+        self._keys = smap._sections['senseKey']
+        self._start = smap._sections['senseStart']
+        self._postings = smap._sections['sensePosting']
+        self._hash = smap._sections['senseHash']
+
+    def _find(self, key):
+        """ looks up the key in the hash table of the snapshot (a miss usually ends at the first empty slot) """
+        if not isinstance( key, str ):
+            return -1
+        key = key.encode('utf-8')
+        table = self._hash
+        mask = len( table ) - 1
+        slot = _stringHash( key ) & mask
+        while True:
+            pos = table[ slot ]
+            if pos == -1 or self._smap._stringBytes( self._keys[ pos ] ) == key:
+                return pos
+            slot = ( slot + 1 ) & mask
+
+    def __getitem__(self, key):
+        pos = self._find( key )
+        if pos == -1:
+            raise KeyError( key )
+        return self._senses( pos )
+
+    def get(self, key, default = None):
+        pos = self._find( key )
+        if pos == -1:
+            return default
+        return self._senses( pos )
+
+    def _senses(self, pos):
+        node = self._smap.node
+        return [ node( n ) for n in self._postings[ self._start[ pos ] : self._start[ pos + 1 ] ] ]
+
+
+class RogetThesaurusArrays:
+    """
+        the ontology of a RogetThesaurus as parallel arrays (one entry per node); node i is the i-th node
+        in preorder, the node with internalId i+1. The subtree of node i is the range of nodes
+        i ... subtreeEnds()[i]-1, so that the helpers below work on ranges of the columns instead of
+        following the parent and child references of the nodes.
+
+        parents, firstChild, nextSibling and links hold node positions (-1 for none), keys hold positions
+        in the string table. The columns are instances of array (or views of a mapped snapshot);
+        the helpers return numpy arrays if numpy is installed and instances of array('i') otherwise.
+    """
+    def __init__(self, types, wordTypes, parents, firstChild, nextSibling, links, keys, strings, node = None):
+        self._types = types
+        self._wordTypes = wordTypes
+        self._parents = parents
+        self._firstChild = firstChild
+        self._nextSibling = nextSibling
+        self._links = links
+        self._keys = keys
+        self._strings = strings
+        self._node = node
+        self._depths = None
+        self._subtreeEnds = None
+
+    @staticmethod
+    def fromThesaurus( roget ):
+        """ builds the arrays of a RogetThesaurus in one walk over its tree """
+        nodes = list( _iterPreorder( roget.rootNode ) )
+        nodeIdx = {}
+        for (i, n) in enumerate(nodes):
+            nodeIdx[ n ] = i
+
+        count = len(nodes)
+        types = array('B', [0]) * count
+        wordTypes = array('B', [0]) * count
+        parents = array('i', [-1]) * count
+        firstChild = array('i', [-1]) * count
+        nextSibling = array('i', [-1]) * count
+        links = array('i', [-1]) * count
+        keys = array('i', [0]) * count
+        strings = []
+        stringIdx = {}
+
+        for (i, n) in enumerate(nodes):
+            types[i] = n._type
+            if n._parent != None:
+                parents[i] = nodeIdx[ n._parent ]
+            prev = -1
+            for c in n._child:
+                c = nodeIdx[ c ]
+                if prev == -1:
+                    firstChild[i] = c
+                else:
+                    nextSibling[ prev ] = c
+                prev = c
+            key = stringIdx.get( n._key )
+            if key == None:
+                key = len(strings)
+                stringIdx[ n._key ] = key
+                strings.append( n._key )
+            keys[i] = key
+            if n._type == ROGET_NODE_HEADWORD or n._type == ROGET_NODE_SENSE:
+                wordTypes[i] = n._wordType
+                if n._link != None:
+                    links[i] = nodeIdx[ n._link ]
+
+        return RogetThesaurusArrays( types, wordTypes, parents, firstChild, nextSibling, links, keys, strings, nodes.__getitem__ )
+
+    def __len__(self):
+        return len( self._types )
+
+    @property
+    def types(self):
+        """ node type of each node """
+        return self._types
+
+    @property
+    def wordTypes(self):
+        """ word type of each node (WORD_TYPE_NONE for categories and sense groups) """
+        return self._wordTypes
+
+    @property
+    def parents(self):
+        """ position of the parent of each node """
+        return self._parents
+
+    @property
+    def firstChild(self):
+        """ position of the first child of each node """
+        return self._firstChild
+
+    @property
+    def nextSibling(self):
+        """ position of the next sibling of each node """
+        return self._nextSibling
+
+    @property
+    def links(self):
+        """ position of the linked head word of each node """
+        return self._links
+
+    @property
+    def keys(self):
+        """ position of the key of each node in the string table """
+        return self._keys
+
+    @property
+    def strings(self):
+        """ the string table (each key appears once) """
+        return self._strings
+
+    def key(self, i):
+        """ returns the key of node i """
+        return self._strings[ self._keys[i] ]
+
+    def node(self, i):
+        """ returns node i of the ontology """
+        return self._node( i )
+
+    def children(self, i):
+        """ returns the positions of the child nodes of node i """
+        ret = []
+        c = self._firstChild[i]
+        while c != -1:
+            ret.append( c )
+            c = self._nextSibling[c]
+        return ret
+
+    def depths(self):
+        """ returns the depth of each node (0 for the root) """
+        if self._depths is None: # (a numpy array does not compare to None)
+            if numpy != None:
+                # each step goes one level up for all nodes at once
+                parents = numpy.asarray( self._parents )
+                depths = numpy.zeros( len(parents), dtype = parents.dtype )
+                up = parents
+                while True:
+                    hasParent = up != -1
+                    if not hasParent.any():
+                        break
+                    depths += hasParent
+                    up = numpy.where( hasParent, parents[ up ], -1 )
+            else:
+                # the parent of a node comes before the node
+                parents = self._parents
+                depths = array('i', [0]) * len(parents)
+                for i in range( 1, len(parents) ):
+                    depths[i] = depths[ parents[i] ] + 1
+            self._depths = depths
+        return self._depths
+
+    def subtreeEnds(self):
+        """ returns for each node the position after the last node of its subtree """
+        if self._subtreeEnds is None:
+            count = len( self._parents )
+            if numpy != None:
+                # the subtree of a node at depth d ends with the next node at depth d or above
+                depths = self.depths()
+                ends = numpy.empty( count, dtype = depths.dtype )
+                for d in range( int( depths.max() ) + 1 if count else 0 ):
+                    pos = numpy.flatnonzero( depths <= d )
+                    nextPos = numpy.append( pos[1:], count )
+                    atDepth = depths[ pos ] == d
+                    ends[ pos[ atDepth ] ] = nextPos[ atDepth ]
+            else:
+                # the subtree of a node ends where the subtree of its last child ends
+                parents = self._parents
+                ends = array('i', range( 1, count + 1 ) )
+                for i in range( count - 1, 0, -1 ):
+                    p = parents[i]
+                    if ends[p] < ends[i]:
+                        ends[p] = ends[i]
+            self._subtreeEnds = ends
+        return self._subtreeEnds
+
+    def nodesUnder(self, i, mask = 0xF):
+        """ returns the positions of the nodes in the subtree of node i (node i included) with a type in mask """
+        end = int( self.subtreeEnds()[i] )
+        if numpy != None:
+            types = numpy.asarray( self._types )[ i : end ]
+            return ( numpy.flatnonzero( types & mask ) + i ).astype( numpy.intc )
+        types = self._types
+        return array('i', [ j for j in range( i, end ) if types[j] & mask ] )
+
+    def sensesUnder(self, i):
+        """ returns the positions of all senses in the subtree of node i """
+        return self.nodesUnder( i, ROGET_NODE_SENSE )
+
+    def asNumPy(self):
+        """ returns the columns as dictionary of numpy arrays (they share the memory of the columns) """
+        if numpy == None:
+            raise Exception("numpy is not installed")
+        return { 'types' : numpy.asarray( self._types ), 'wordTypes' : numpy.asarray( self._wordTypes ),
+                 'parents' : numpy.asarray( self._parents ), 'firstChild' : numpy.asarray( self._firstChild ),
+                 'nextSibling' : numpy.asarray( self._nextSibling ), 'links' : numpy.asarray( self._links ),
+                 'keys' : numpy.asarray( self._keys ) }
+
+
+""" punctuation that is removed around a word by the normalization """
+_NORMALIZE_STRIP = ' \t\n.,;:!?\'"()[]{}'
+
+def _consonants( token ):
+    """ the string with 'c' for each consonant and 'v' for each vowel of token; y is a vowel after a consonant """
+    form = []
+    for (i, c) in enumerate( token ):
+        if c in 'aeiou' or ( c == 'y' and i > 0 and form[-1] == 'c' ):
+            form.append( 'v' )
+        else:
+            form.append( 'c' )
+    return ''.join( form )
+
+def _isShortStem( stem ):
+    """ true if the stem has a single vowel group that is followed by a consonant (other than w, x, y) at its end, as in
+        'hop' or 'lov'. An e is added to such a stem after a suffix is stripped and kept at the end of a word """
+    form = _consonants( stem )
+    return form.count( 'vc' ) == 1 and form.endswith( 'cvc' ) and not stem[-1] in 'wxy'
+
+def _lemma( token ):
+    """ a lightweight lemmatizer (after the first and the last step of the Porter stemmer): strips the suffixes of plurals
+        and of the third person; strips -ed and -ing and undoes a doubled consonant or adds the e of a short stem,
+        so that 'loves', 'loved' and 'loving' become 'love', 'hopping' becomes 'hop' and 'hoping' becomes 'hope';
+        -eed becomes ee, and a final e is stripped where it would not be added after a suffix ('approve', 'approved') """
+    if len( token ) <= 3 or not token.isalpha():
+        return token
+    if token.endswith('ies') and len( token ) > 4:
+        token = token[ : -3 ] + 'y'
+    elif token.endswith('sses') or token.endswith('ches') or token.endswith('shes') or token.endswith('xes') or token.endswith('zes'):
+        token = token[ : -2 ]
+    elif token.endswith('s') and not ( token.endswith('ss') or token.endswith('us') or token.endswith('is') ):
+        token = token[ : -1 ]
+
+    stem = None
+    if token.endswith('ied') and len( token ) > 4:
+        token = token[ : -3 ] + 'y'
+    elif token.endswith('ed') and not token.endswith('eed'):
+        stem = token[ : -2 ]
+    elif token.endswith('ing'):
+        stem = token[ : -3 ]
+    # the stem keeps a vowel: 'bed', 'thing' and 'spring' stay as they are
+    if stem != None and 'v' in _consonants( stem ):
+        if len( stem ) > 3 and stem[-1] == stem[-2] and _consonants( stem[-2:] ) == 'cc' and not stem[-1] in 'lsfz':
+            # stopped, running
+            token = stem[ : -1 ]
+        elif _isShortStem( stem ):
+            token = stem + 'e'
+        else:
+            token = stem
+
+    if token.endswith('eed') and len( token ) > 4:
+        # freed, agreed
+        token = token[ : -1 ]
+    if token.endswith('e') and len( token ) > 3 and not _isShortStem( token[ : -1 ] ) and _consonants( token[ : -1 ] ).count( 'vc' ) > 0:
+        token = token[ : -1 ]
+    return token
+
+def _normalizedForm( word ):
+    """ the key of a word in the normalized index: case folded, with single spaces, without the punctuation around it,
+        and each token lemmatized """
+    return ' '.join( [ _lemma( token ) for token in word.casefold().strip( _NORMALIZE_STRIP ).split() ] )
+
+def _deletes( s, count ):
+    """ returns the set of strings that result from deleting up to count characters of s """
+    ret = { s }
+    level = [ s ]
+    for _ in range( count ):
+        nextLevel = []
+        for w in level:
+            for i in range( len(w) ):
+                d = w[ : i ] + w[ i + 1 : ]
+                if not d in ret:
+                    ret.add( d )
+                    nextLevel.append( d )
+        level = nextLevel
+    return ret
+
+def _editDistance( a, b, maxDistance ):
+    """ the Damerau-Levenshtein distance of two strings (optimal string alignment: an adjacent transposition
+        counts as one edit); returns maxDistance + 1 if the distance is larger than maxDistance """
+    if abs( len(a) - len(b) ) > maxDistance:
+        return maxDistance + 1
+    # the common prefix and suffix do not change the distance
+    start = 0
+    while start < len(a) and start < len(b) and a[ start ] == b[ start ]:
+        start += 1
+    endA = len(a)
+    endB = len(b)
+    while endA > start and endB > start and a[ endA - 1 ] == b[ endB - 1 ]:
+        endA -= 1
+        endB -= 1
+    a = a[ start : endA ]
+    b = b[ start : endB ]
+    if not a or not b:
+        return len(a) + len(b)
+
+    # only the cells within maxDistance of the diagonal can be on a path with distance up to maxDistance
+    lenA = len(a)
+    lenB = len(b)
+    tooFar = maxDistance + 1
+    before = None
+    previous = [ j if j <= maxDistance else tooFar for j in range( lenB + 1 ) ]
+    for i in range( 1, lenA + 1 ):
+        ca = a[ i - 1 ]
+        current = [ tooFar ] * ( lenB + 1 )
+        if i <= maxDistance:
+            current[0] = i
+        rowMin = current[0]
+        for j in range( max( 1, i - maxDistance ), min( lenB, i + maxDistance ) + 1 ):
+            cb = b[ j - 1 ]
+            d = previous[ j - 1 ] + ( ca != cb )
+            if previous[ j ] < d:
+                d = previous[ j ] + 1
+            if current[ j - 1 ] < d:
+                d = current[ j - 1 ] + 1
+            if i > 1 and j > 1 and ca == b[ j - 2 ] and a[ i - 2 ] == cb and before[ j - 2 ] < d:
+                d = before[ j - 2 ] + 1
+            current[ j ] = d
+            if d < rowMin:
+                rowMin = d
+        if rowMin > maxDistance:
+            return tooFar
+        before = previous
+        previous = current
+    return min( previous[ lenB ], tooFar )
+
+def _charMask( s ):
+    """ the set of characters of a string as 64 bit mask (characters with the same code modulo 64 share a bit) """
+    mask = 0
+    for c in set( s ):
+        mask |= 1 << ( ord( c ) & 63 )
+    return mask
+
+class _FuzzyIndex:
+    """
+        symmetric delete index (as in SymSpell) over the case folded sense keys. The keys are sorted, so that the keys
+        with the same prefix form a range. For each distinct prefix, the strings that result from deleting up to
+        maxDistance of its characters are stored as 32 bit hashes in a sorted array, along with the number of the prefix.
+        A word within maxDistance of a key has a prefix that shares one of these strings with the prefix of the key;
+        the keys of the prefixes that are found are then checked with the edit distance.
+    """
+    _PREFIX_LENGTH = 7
+
+    def __init__(self, keys, maxDistance ):
+        entries = sorted( ( key.casefold(), key ) for key in keys )
+        self._folded = [ folded for (folded, _) in entries ]
+        self._keys = [ key for (_, key) in entries ]
+        self._maxDistance = maxDistance
+
+        prefixes = []
+        self._prefixStart = array('i')
+        for (i, folded) in enumerate( self._folded ):
+            prefix = folded[ : self._PREFIX_LENGTH ]
+            if not prefixes or prefixes[-1] != prefix:
+                prefixes.append( prefix )
+                self._prefixStart.append( i )
+        self._prefixStart.append( len( self._folded ) )
+
+        self._charMasks = array('Q', [ _charMask( folded ) for folded in self._folded ] )
+
+        # hash and prefix number in one integer, so that one sort orders both
+        bits = len(prefixes).bit_length()
+        combined = []
+        for (pos, prefix) in enumerate(prefixes):
+            for d in _deletes( prefix, maxDistance ):
+                combined.append( ( hash( d ) & 0xFFFFFFFF ) << bits | pos )
+        combined.sort()
+        mask = ( 1 << bits ) - 1
+        self._hashes = array('I', [ c >> bits for c in combined ] )
+        self._prefixes = array('i', [ c & mask for c in combined ] )
+
+    @property
+    def maxDistance(self):
+        return self._maxDistance
+
+    def lookup(self, word, maxDistance ):
+        """ returns the sorted list of (distance, key) of the keys within maxDistance of word """
+        word = word.casefold()
+        hashes = self._hashes
+        count = len( hashes )
+        prefixes = set()
+        for d in _deletes( word[ : self._PREFIX_LENGTH ], maxDistance ):
+            h = hash( d ) & 0xFFFFFFFF
+            i = bisect.bisect_left( hashes, h )
+            while i < count and hashes[i] == h:
+                prefixes.add( self._prefixes[i] )
+                i += 1
+
+        ret = []
+        folded = self._folded
+        charMasks = self._charMasks
+        length = len( word )
+        wordMask = _charMask( word )
+        # each edit changes at most two bits of the character mask
+        maxMaskDiff = 2 * maxDistance
+        for prefix in prefixes:
+            for i in range( self._prefixStart[ prefix ], self._prefixStart[ prefix + 1 ] ):
+                if abs( len( folded[i] ) - length ) <= maxDistance and bin( charMasks[i] ^ wordMask ).count('1') <= maxMaskDiff:
+                    distance = _editDistance( word, folded[i], maxDistance )
+                    if distance <= maxDistance:
+                        ret.append( ( distance, self._keys[i] ) )
+        ret.sort()
+        return ret
+
+""" a token of a phrase: a run of letters and digits """
+_tokenRe = re.compile( r'[^\W_]+' )
+
+def _tokens( text ):
+    return _tokenRe.findall( text.casefold() )
+
+class _TokenIndex:
+    """
+        inverted index over the phrase senses (the senses and head words with more than one token in their key):
+        maps each case folded token to the sorted array of the internal ids of the phrases that contain it
+    """
+    def __init__(self, senseIndex ):
+        phrases = []
+        for senses in senseIndex.values():
+            for node in senses:
+                tokens = _tokens( node.key )
+                if len( tokens ) > 1:
+                    phrases.append( ( node.internalId, node, tokens ) )
+        phrases.sort( key = lambda phrase: phrase[0] )
+
+        postings = {}
+        for (nodeId, _, tokens) in phrases:
+            for token in tokens:
+                posting = postings.get( token )
+                if posting == None:
+                    postings[ token ] = array('i', [ nodeId ] )
+                elif posting[-1] != nodeId:
+                    posting.append( nodeId )
+        self._postings = postings
+        self._ids = array('i', [ nodeId for (nodeId, _, _) in phrases ] )
+        self._nodes = [ node for (_, node, _) in phrases ]
+
+    def posting(self, token ):
+        return self._postings.get( token )
+
+    def lookup(self, tokens ):
+        """ returns the phrase nodes that contain all tokens, in preorder """
+        postings = []
+        for token in tokens:
+            posting = self._postings.get( token )
+            if posting == None:
+                return []
+            postings.append( posting )
+        if not postings:
+            return []
+
+        # the ids of the shortest list are searched in the others
+        postings.sort( key = len )
+        ids = postings[0]
+        for other in postings[ 1 : ]:
+            if len( other ) > 16 * len( ids ):
+                # binary search; the search in the long list starts where the last one ended
+                found = array('i')
+                pos = 0
+                count = len( other )
+                for nodeId in ids:
+                    pos = bisect.bisect_left( other, nodeId, pos )
+                    if pos == count:
+                        break
+                    if other[ pos ] == nodeId:
+                        found.append( nodeId )
+            else:
+                other = set( other )
+                found = array('i', [ nodeId for nodeId in ids if nodeId in other ] )
+            ids = found
+
+        return [ self._nodes[ bisect.bisect_left( self._ids, nodeId ) ] for nodeId in ids ]
+
+def _commonCode( codes1, codes2 ):
+    """ returns the first code of the sorted similarity signature codes1 that is also in codes2, or -1;
+        this is the common code with the best score """
+    if len( codes1 ) > len( codes2 ):
+        (codes1, codes2) = (codes2, codes1)
+    count2 = len( codes2 )
+    for code in codes1:
+        i = bisect.bisect_left( codes2, code )
+        if i < count2 and codes2[ i ] == code:
+            return code
+    return -1
+
 class RogetThesaurus:
     """ class Roget
         The Roget Thesaurus class
@@ -546,10 +2174,51 @@ class RogetThesaurus:
     #    self._headWordIndex = None
     #    self._senseIndex = None
 
+    """ default number of words with a cached similarity signature """
+    _CACHE_SIZE = 4096
+
     def __init__(self, rootNode = None, headWordIndex = None, senseIndex = None ):
         self._rootNode = rootNode
         self._headWordIndex = headWordIndex
         self._senseIndex = senseIndex
+        self._arrays = None
+        self._signatures = None
+        self._normalizedIndex = None
+        self._prefixIndex = None
+        self._fuzzyIndex = None
+        self._tokenIndex = None
+        self._passages = None
+        self._cache = OrderedDict()
+        self._cacheSize = self._CACHE_SIZE
+        self._cacheHits = 0
+        self._cacheMisses = 0
+        self._cacheLock = threading.Lock()
+
+    def __getstate__(self):
+        # the lock can not be pickled; the cache of similarity signatures starts empty in the copy
+        state = self.__dict__.copy()
+        del state['_cacheLock']
+        del state['_cache']
+        del state['_cacheHits']
+        del state['_cacheMisses']
+        return state
+
+    def __setstate__(self, state ):
+        self.__dict__.update( state )
+        self._cache = OrderedDict()
+        self._cacheHits = 0
+        self._cacheMisses = 0
+        self._cacheLock = threading.Lock()
+
+    def _invalidate(self):
+        """ drops the data that is derived from the ontology, after the ontology has been changed (see RogetBuilder.update) """
+        self._arrays = None
+        self._signatures = None
+        self._normalizedIndex = None
+        self._prefixIndex = None
+        self._fuzzyIndex = None
+        self._tokenIndex = None
+        self.clearCache()
 
     @property
     def rootNode(self):
@@ -566,32 +2235,226 @@ class RogetThesaurus:
         """ the index of word senses - maps the word sense to a list of nodes in the ontology """
         return self._senseIndex
 
-    # add all parent nodes to array (up to first category); adds the
+    def arrays(self):
+        """ returns the ontology as RogetThesaurusArrays; the arrays are built on first use (a loaded snapshot has them already) """
+        if self._arrays == None:
+            self._arrays = RogetThesaurusArrays.fromThesaurus( self )
+        return self._arrays
+
+    def _ancestorCodes(self, node, chains ):
+        """ returns the signature codes of the node and its parents up to the first category (see _similaritySignature) """
+        if node.type == ROGET_NODE_SENSE:
+            # the senses of a group or of a head word share the codes of their parent
+            node = node.parent
+        ret = chains.get( node ) if chains != None else None
+        if ret == None:
+            ret = []
+            n = node
+            while n != None:
+                typ = n.type
+                ret.append( ( _SIGNATURE_LEVEL[ typ ] | n.internalId, n ) )
+                if typ == ROGET_NODE_CATEGORY:
+                    break
+                n = n.parent
+            if chains != None:
+                chains[ node ] = ret
+        return ret
 
-    def _semHelpAddParents( self, s, ret):
-        while s != None:
-            ret.append( s )
-            if s.type == ROGET_NODE_CATEGORY:
+    @property
+    def normalizedIndex(self):
+        """ the normalized index - maps the normalized form of a word (see lookupNormalized) to the tuple of senseIndex keys with that form;
+            None if it has not been built (see buildNormalizedIndex) """
+        return self._normalizedIndex
+
+    def buildNormalizedIndex(self):
+        """ builds the normalized index (RogetBuilder.parse and load build it if asked to) """
+        index = {}
+        for key in self._senseIndex:
+            form = _normalizedForm( key )
+            if form == '':
+                # a key of punctuation only ('.', '( )') is not a word
+                continue
+            keys = index.get( form )
+            if keys == None:
+                index[ form ] = ( key, )
+            else:
+                # sorted, so that the result does not depend on the order of the sense index
+                index[ form ] = tuple( sorted( keys + ( key, ) ) )
+        self._normalizedIndex = index
+
+    def lookupNormalized(self, word ):
+        """ returns the tuple of senseIndex keys that have the same normalized form as word;
+            an empty tuple if there are none. The normalized form is case folded, with single spaces, without
+            the punctuation around the word, and each token is lemmatized by stripping its suffixes, so that
+            'Love', 'love ' and 'loves' all find 'love'. A word that is empty after the normalization (only blanks
+            or punctuation) finds nothing. The normalized index is built on first use if needed """
+        form = _normalizedForm( word )
+        if form == '':
+            return ()
+        if self._normalizedIndex == None:
+            self.buildNormalizedIndex()
+        return self._normalizedIndex.get( form, () )
+
+    def _sortedKeys(self):
+        """ the prefix index: the keys of the sense index in sorted order (a snapshot has them in this order already) """
+        if self._prefixIndex == None:
+            self._prefixIndex = sorted( self._senseIndex )
+        return self._prefixIndex
+
+    def iterCompletions(self, prefix ):
+        """ yields the keys of the sense index that start with prefix, in sorted order """
+        keys = self._sortedKeys()
+        count = len( keys )
+        i = bisect.bisect_left( keys, prefix )
+        while i < count:
+            key = keys[i]
+            if not key.startswith( prefix ):
                 break
-            s = s.parent
-
-    def _semHelpSortedSet( self, word ):
-        senses = self.senseIndex
-        wordSenses = senses[ word ]
-        ret = []
-        if wordSenses != None:
-            for s in wordSenses:
-                self._semHelpAddParents( s, ret )
-                if s.link != None:
-                    self._semHelpAddParents( s.link, ret )
-            ret.sort( key=lambda elm: elm.internalId ) # sort by internal id
-
-        #print("[")
-        #for s in ret:
-        #    print s.internalId, "," ,
-        #print("]")
+            yield key
+            i += 1
+
+    def completions(self, prefix, limit = 10 ):
+        """ returns the list of the first (in sorted order) limit keys of the sense index that start with prefix """
+        return list( itertools.islice( self.iterCompletions( prefix ), limit ) )
+
+    def buildFuzzyIndex(self, maxDistance = 2 ):
+        """ builds the index of fuzzyLookup for queries with up to maxDistance edits (RogetBuilder.parse and load build it if asked to) """
+        self._fuzzyIndex = _FuzzyIndex( self._senseIndex, maxDistance )
+
+    def fuzzyLookup(self, word, maxDistance = 2 ):
+        """ returns the words of the thesaurus that differ from word by up to maxDistance edits (insertion, deletion
+            or substitution of a character, or transposition of two adjacent characters), ignoring case.
+            returns list of tuples (key, distance, list of nodes of the word sense), sorted by distance and key.
+            The index is built on first use if needed (this takes a few seconds) """
+        if self._fuzzyIndex == None or self._fuzzyIndex.maxDistance < maxDistance:
+            self.buildFuzzyIndex( max( maxDistance, 2 ) )
+        senses = self._senseIndex
+        return [ ( key, distance, senses[ key ] ) for (distance, key) in self._fuzzyIndex.lookup( word, maxDistance ) ]
+
+    def phrasesContaining(self, *tokens ):
+        """ returns the list of phrase senses (senses and head words with more than one word in their key) that contain
+            all of the given tokens (words), in the order of the ontology. Case is ignored; an argument with several
+            words counts as each of its words. The token index is built on first use """
+        if self._tokenIndex == None:
+            self._tokenIndex = _TokenIndex( self._senseIndex )
+        return self._tokenIndex.lookup( [ token for text in tokens for token in _tokens( text ) ] )
+
+    def iterNodes(self, mask = 0xF, root = None, depth = False ):
+        """ yields the nodes below root (rootNode if root is None), and root itself, in preorder; only the nodes
+            with a type in mask (as in RogetThesaususFormatterText.show: ROGET_NODE_CATEGORY | ROGET_NODE_HEADWORD ...).
+            if depth is set then the tuple ( depth, node ) is yielded instead, depth is the number of parents of node.
+            The nodes are visited as the generator is consumed, without copying the tree; the nodes below the head
+            words are only visited if mask has sense groups or senses (so that the head words of a lazy thesaurus are
+            not parsed). """
+        if root == None:
+            root = self._rootNode
+        start = 0
+        n = root.parent
+        while n != None:
+            start += 1
+            n = n.parent
+        leafTypes = _leafTypes( mask )
+        if depth:
+            for item in _iterPreorderDepth( root, start, leafTypes ):
+                if item[1]._type & mask:
+                    yield item
+        else:
+            for (_, node) in _iterPreorderDepth( root, start, leafTypes ):
+                if node._type & mask:
+                    yield node
+
+    def iterSenses(self, root = None, depth = False ):
+        """ yields the senses (ROGET_NODE_SENSE) below root in preorder, see iterNodes """
+        return self.iterNodes( ROGET_NODE_SENSE, root, depth )
+
+    def iterHeadWords(self, root = None, depth = False ):
+        """ yields the head words below root in preorder, see iterNodes """
+        return self.iterNodes( ROGET_NODE_HEADWORD, root, depth )
+
+    def lookup(self, word ):
+        """ returns the list of nodes of a word sense (as senseIndex[ word ]); None if the word is not in the thesaurus """
+        return self._senseIndex.get( word )
+
+    def contains(self, word ):
+        """ returns True if the word sense is in the thesaurus """
+        return word in self._senseIndex
+
+    def _makeSignature(self, word, chains = None ):
+        senses = self._senseIndex.get( word )
+        if senses == None:
+            return _NO_SIGNATURE
+        codes = {}
+        for s in senses:
+            codes.update( self._ancestorCodes( s, chains ) )
+            if s.link != None:
+                codes.update( self._ancestorCodes( s.link, chains ) )
+        order = sorted( codes )
+        return ( tuple( order ), tuple( [ codes[ c ] for c in order ] ) )
+
+    def _similaritySignature(self, word ):
+        """ the signature of a word: the codes of the sense groups, head words and categories that contain one
+            of its senses (or the head word linked by one of them), sorted by score and then by internal id;
+            and the nodes of these codes in the same order """
+        if self._signatures != None:
+            # has all words of the thesaurus
+            return self._signatures.get( word, _NO_SIGNATURE )
+        if self._cacheSize == 0:
+            return self._makeSignature( word )
+
+        with self._cacheLock:
+            ret = self._cache.get( word )
+            if ret != None:
+                self._cache.move_to_end( word )
+                self._cacheHits += 1
+                return ret
+            self._cacheMisses += 1
+        ret = self._makeSignature( word )
+        if ret is _NO_SIGNATURE:
+            # words that are not in the thesaurus would push the known ones out of the cache
+            return ret
+        with self._cacheLock:
+            self._cache[ word ] = ret
+            while len( self._cache ) > self._cacheSize:
+                self._cache.popitem( last = False )
         return ret
 
+    def ancestors(self, word ):
+        """ returns the tuple of sense groups, head words and categories that the semantic similarity of word is based on:
+            the nodes that contain one of its senses (or the head word linked by one of them), up to the first category.
+            sense groups come first, then head words, then categories; each kind is sorted by internalId """
+        return self._similaritySignature( word )[1]
+
+    def setCacheSize(self, size ):
+        """ sets the number of words whose similarity signature (see ancestors) is kept in the least recently used cache;
+            0 turns the cache off. The default is 4096 words """
+        with self._cacheLock:
+            self._cacheSize = size
+            while len( self._cache ) > size:
+                self._cache.popitem( last = False )
+
+    def cacheInfo(self):
+        """ returns the tuple (hits, misses, maximum size, current size) of the cache of similarity signatures """
+        with self._cacheLock:
+            return ( self._cacheHits, self._cacheMisses, self._cacheSize, len( self._cache ) )
+
+    def clearCache(self):
+        """ removes all entries from the cache of similarity signatures and resets its counters """
+        with self._cacheLock:
+            self._cache.clear()
+            self._cacheHits = 0
+            self._cacheMisses = 0
+
+    def precomputeSimilarity(self):
+        """ builds the similarity signatures of all words at once, so that semanticSimilarity does not need to
+            walk the ontology anymore; without it the signature of a word is computed on its first use and kept in a
+            least recently used cache (see setCacheSize), and computed again if it has been dropped from the cache """
+        chains = {}
+        signatures = {}
+        with _pausedGC():
+            for word in self.senseIndex:
+                signatures[ word ] = self._makeSignature( word, chains )
+        self._signatures = signatures
+
     def semanticSimilarity( self, seq1, seq2 ):
         """ computes the semantic similarity between two terms,
 
@@ -606,120 +2469,313 @@ class RogetThesaurus:
 
             common-node-in-roget-thesaurus: is None if the score is 0;
             otherwise it is the common node that the score is based on
-        """
-        arr1 = self._semHelpSortedSet( seq1 )
-        arr2 = self._semHelpSortedSet( seq2 )
-
 
-        # merging two sorted arrays
-        score = 0
-        rnode = None
-
-        pos1 = 0
-        pos2 = 0
-        if arr1 == None or arr2 == None:
+            the score is 0 if one of the terms is not in the thesaurus
+        """
+        (codes1, nodes1) = self._similaritySignature( seq1 )
+        (codes2, nodes2) = self._similaritySignature( seq2 )
+        code = _commonCode( codes1, codes2 )
+        if code == -1:
             return (0, None)
+        return ( _SIGNATURE_SCORE[ code >> _SIGNATURE_SHIFT ], nodes1[ bisect.bisect_left( codes1, code ) ] )
+
+    def _signaturesOf(self, words ):
+        """ returns a dictionary that maps each distinct word to its similarity signature """
+        ret = {}
+        for word in words:
+            if not word in ret:
+                ret[ word ] = self._similaritySignature( word )
+        return ret
 
-        while pos1 < len( arr1 ) and pos2 < len( arr2 ):
-            if arr1[ pos1 ].internalId == arr2[ pos2 ].internalId:
-                node = arr1[ pos1 ]
-                if node.type == ROGET_NODE_CATEGORY:
-                    nscore = 80
-                elif node.type == ROGET_NODE_HEADWORD:
-                    nscore = 90
-                elif node.type == ROGET_NODE_SENSE_GROUP:
-                    nscore = 100
-
-                if score < nscore:
-                    score = nscore
-                    rnode = node
-                    if score == 100:
-                        break
-                pos1 += 1
-                pos2 += 1
-            elif arr1[ pos1 ].internalId < arr2[ pos2 ].internalId:
-                pos1 += 1
-            else:
-                pos2 += 1
+    def semanticSimilarityBatch( self, pairs ):
+        """ computes the semantic similarity of each pair of terms (see semanticSimilarity)
 
-        return (score, rnode)
+            returns the tuple (scores, node-ids): the similarity score of each pair and the internalId
+            of the common node that the score is based on (0 if the score is 0). These are numpy arrays
+            if numpy is installed and instances of array otherwise.
+
+            each distinct word is looked up once, and each distinct pair is scored once.
+        """
+        pairs = list( pairs )
+        signatures = self._signaturesOf( word for pair in pairs for word in pair )
+        scores = array('B', [0]) * len(pairs)
+        nodeIds = array('i', [0]) * len(pairs)
+        results = {}
+        for (i, (w1, w2)) in enumerate(pairs):
+            # (a pair can be any sequence of two words, a list is not hashable)
+            code = results.get( ( w1, w2 ) )
+            if code == None:
+                code = _commonCode( signatures[ w1 ][0], signatures[ w2 ][0] )
+                results[ ( w1, w2 ) ] = code
+            if code != -1:
+                scores[i] = _SIGNATURE_SCORE[ code >> _SIGNATURE_SHIFT ]
+                nodeIds[i] = code & _SIGNATURE_ID_MASK
+        if numpy != None:
+            return ( numpy.asarray( scores ), numpy.asarray( nodeIds ) )
+        return ( scores, nodeIds )
+
+    def similarityMatrix( self, wordsA, wordsB ):
+        """ computes the semantic similarity of each term in wordsA with each term in wordsB (see semanticSimilarity)
+
+            returns the tuple (scores, node-ids); scores[i][j] is the similarity score of wordsA[i] and wordsB[j],
+            node-ids[i][j] is the internalId of the common node (0 if the score is 0). These are two dimensional
+            numpy arrays if numpy is installed and lists of rows (instances of array) otherwise.
+        """
+        wordsA = list( wordsA )
+        wordsB = list( wordsB )
+        signatures = self._signaturesOf( wordsA + wordsB )
+        columns = len( wordsB )
+
+        # only the pairs that have a node in common are visited: for each code, the rows that have the code
+        rows = {}
+        for (i, word) in enumerate(wordsA):
+            for code in signatures[ word ][0]:
+                rowsOfCode = rows.get( code )
+                if rowsOfCode == None:
+                    rows[ code ] = [ i * columns ]
+                else:
+                    rowsOfCode.append( i * columns )
+
+        scores = array('B', [0]) * ( len(wordsA) * columns )
+        nodeIds = array('i', [0]) * ( len(wordsA) * columns )
+        for (j, word) in enumerate(wordsB):
+            # the codes are sorted by score; the first common code of a pair is its result
+            for code in signatures[ word ][0]:
+                rowsOfCode = rows.get( code )
+                if rowsOfCode != None:
+                    score = _SIGNATURE_SCORE[ code >> _SIGNATURE_SHIFT ]
+                    nodeId = code & _SIGNATURE_ID_MASK
+                    for row in rowsOfCode:
+                        if scores[ row + j ] == 0:
+                            scores[ row + j ] = score
+                            nodeIds[ row + j ] = nodeId
+
+        if numpy != None:
+            shape = ( len(wordsA), columns )
+            return ( numpy.asarray( scores ).reshape( shape ), numpy.asarray( nodeIds ).reshape( shape ) )
+        return ( [ scores[ i * columns : ( i + 1 ) * columns ] for i in range( len(wordsA) ) ],
+                 [ nodeIds[ i * columns : ( i + 1 ) * columns ] for i in range( len(wordsA) ) ] )
 
 class RogetThesaususFormatterText:
     """
         class for formatting of Roget thesaurus as text report
     """
+    """ the lines are collected and written in chunks of this many lines """
+    _LINES_PER_WRITE = 2048
+
     def show(self, roget, file, mask = 0xF ):
         self._showRogetTextImp( roget.rootNode, 1, file, mask)
 
     def _showRogetTextImp(self, node, depth, file, mask ):
 
-        if node.type & mask != 0:
-            line = ''
-            for _ in range(1,depth):
-                line += '\t'
-            line += node.toString() + '\n'
-            file.write( line )
-
-        for n  in node.child:
-            self._showRogetTextImp(n , depth + 1, file, mask )
+        # the indents of the lines by depth
+        indents = []
+        lines = []
+        append = lines.append
+        linesPerWrite = self._LINES_PER_WRITE * 3
+        leafTypes = _leafTypes( mask )
+        for (nodeDepth, n) in _iterPreorderDepth( node, depth - 1, leafTypes ):
+            if n._type & mask != 0:
+                while len( indents ) <= nodeDepth:
+                    indents.append( '\t' * len( indents ) )
+                append( indents[ nodeDepth ] )
+                append( n.toString() )
+                append( '\n' )
+                if len( lines ) >= linesPerWrite:
+                    file.write( ''.join( lines ) )
+                    lines.clear()
+        if lines:
+            file.write( ''.join( lines ) )
+
+# white space other than blanks is written as character reference, otherwise it is replaced by blanks in attribute values
+_XML_ESCAPES = str.maketrans( { '&' : '&amp;', '<' : '&lt;', '>' : '&gt;', '"' : '&quot;', '\t' : '&#9;', '\n' : '&#10;', '\r' : '&#13;' } )
 
 def escapeStr( s ):
-    s = s.replace("<", "&lt;")
-    s = s.replace(">", "&gt;")
-    s = s.replace("\"", "&quot;")
-    return s
+    """ escapes the characters of s that are special in xml text and attribute values, in one pass """
+    return s.translate( _XML_ESCAPES )
 
 
 class RogetThesaurusFormatterXML:
     """
         class for formatting of Roget thesaurus as xml
     """
-    def show(self, roget, file):
-
-        file.write( "<?xml version='1.0'?>\n<rogetThesaurus>\n<ontology>" )
-        self._showRogetXMLNodes( roget.rootNode, file )
-        file.write( "</ontology>" )
-        file.write( "</rogetThesaurus>" )
-
-    def _showRogetXMLNodes( self, node, file ):
-
-        txt = "<" + node.typeToString() + " "
-
-        if node.type == ROGET_NODE_CATEGORY:
-            txt += 'name="' + escapeStr( node.key ) + '"'
-        #elif node.type == ROGET_NODE_SENSE_GROUP:
-            # nothing to do
-        elif node.type == ROGET_NODE_SENSE or node.type == ROGET_NODE_HEADWORD:
-            if node.type == ROGET_NODE_HEADWORD:
-                txt += 'id="' + escapeStr( node.index ) + '" '
-            txt += 'sense="' + escapeStr( node.key ) + '" '
-            if node.wordType != WORD_TYPE_NONE:
-                txt += ' wordType="'
-                if node.wordType ==  WORD_TYPE_ADJ:
-                    txt += 'Adj'
-                if node.wordType ==  WORD_TYPE_VERB:
-                    txt += 'V'
-                if node.wordType ==  WORD_TYPE_ADVERB:
-                    txt += 'Adv'
-                if node.wordType ==  WORD_TYPE_NOUN:
-                    txt += 'N'
-                if node.wordType ==  WORD_TYPE_PHRASE:
-                    txt += 'Phr'
-                txt += '" '
-            if node.comment != '':
-                txt += ' comment="' + escapeStr( node.comment ) + '" '
-            if node.link != None:
-                txt += ' link="' + escapeStr( node.link.index ) + '" '
-                if node.link.key != None:
-                    txt  += ' linkComment="' + escapeStr( node.link.key )+ '" '
-        txt += ">"
-        file.write( txt + '\n' )
-
-        for n  in node.child:
-            self._showRogetXMLNodes( n, file )
-            file.write( " " )
-
-        file.write( "</" + node.typeToString() + ">" )
-
-
-
+    """ the elements are collected and written in chunks of this many elements """
+    _ELEMENTS_PER_WRITE = 2048
+    """ gzip level of the compressed export: level 9 is four times slower and only three percent smaller """
+    _COMPRESS_LEVEL = 6
+
+    def show(self, roget, file, root = None, mask = 0xF, compress = False ):
+        """ writes the ontology as xml to file; only the subtree of root if root is set, and only the nodes with
+            a type in mask (as in RogetThesaususFormatterText.show; the nodes below a node that is left out are
+            written into its closest parent that is written). A node without child elements is an empty element.
+            if compress is set then file is a binary file, and the xml is written to it as gzip compressed utf-8 """
+        if compress:
+            with gzip.GzipFile( fileobj = file, mode = 'wb', compresslevel = self._COMPRESS_LEVEL ) as out:
+                self._show( roget, lambda text: out.write( text.encode() ), root, mask )
+        else:
+            self._show( roget, file.write, root, mask )
+
+    def _show(self, roget, write, root, mask ):
+        write( "<?xml version='1.0'?>\n<rogetThesaurus>\n<ontology>\n" )
+        self._showRogetXMLNodes( root if root != None else roget.rootNode, write, mask )
+        write( "</ontology>\n</rogetThesaurus>\n" )
+
+    def _showRogetXMLNodes( self, node, write, mask ):
+
+        parts = []
+        append = parts.append
+        count = 0
+        # the depth and the name of the elements that are not closed yet
+        openElements = []
+        leafTypes = _leafTypes( mask )
+
+        for (depth, n) in _iterPreorderDepth( node, 0, leafTypes ):
+            typ = n._type
+            if typ & mask == 0:
+                continue
+            while openElements and openElements[-1][0] >= depth:
+                append( '</' + openElements.pop()[1] + '>\n' )
+
+            name = _NODE_TYPE_NAMES[ typ ]
+            append( '<' + name )
+            self._attributes( n, append )
+            if typ & leafTypes == 0 and n._child:
+                append( '>\n' )
+                openElements.append( ( depth, name ) )
+            else:
+                append( '/>\n' )
+
+            count += 1
+            if count >= self._ELEMENTS_PER_WRITE:
+                write( ''.join( parts ) )
+                parts.clear()
+                count = 0
+
+        while openElements:
+            append( '</' + openElements.pop()[1] + '>\n' )
+        write( ''.join( parts ) )
+
+    def _attributes( self, node, append ):
+        """ appends the attributes of the element of node """
+        typ = node._type
+        if typ == ROGET_NODE_CATEGORY:
+            append( ' name="' + escapeStr( node._key ) + '"' )
+        elif typ == ROGET_NODE_SENSE or typ == ROGET_NODE_HEADWORD:
+            if typ == ROGET_NODE_HEADWORD:
+                append( ' id="' + escapeStr( node._index ) + '"' )
+            append( ' sense="' + escapeStr( node._key ) + '"' )
+            wordType = _WORD_TYPE_NAMES.get( node._wordType )
+            if wordType != None:
+                append( ' wordType="' + wordType + '"' )
+            if node._comment != '':
+                append( ' comment="' + escapeStr( node._comment ) + '"' )
+            link = node._link
+            if link != None:
+                append( ' link="' + escapeStr( link._index ) + '"' )
+                if link._key != None:
+                    append( ' linkComment="' + escapeStr( link._key ) + '"' )
+
+
+def _jsonString( s ):
+    """ returns s as a json string, or null if s is None """
+    return 'null' if s == None else _encodeJsonString( s )
+
+def _orjsonRecord( internalId, parent, typ, key, index, wordType, comment, link, path ):
+    """ returns a record of RogetThesaurusFormatterJSONL as utf-8, formatted by orjson """
+    return orjson.dumps( { 'id' : internalId, 'parent' : parent, 'type' : typ, 'key' : key, 'index' : index,
+                           'wordType' : wordType, 'comment' : comment, 'link' : link, 'path' : path } )
+
+def _jsonRecord( internalId, parent, typ, key, index, wordType, comment, link, path ):
+    """ returns a record of RogetThesaurusFormatterJSONL as a string; path is the text of the list of ids """
+    return ''.join( ( '{"id":', str( internalId ), ',"parent":', 'null' if parent == None else str( parent ), ',"type":"', typ,
+                      '","key":', _jsonString( key ), ',"index":', _jsonString( index ), ',"wordType":', _jsonString( wordType ),
+                      ',"comment":', _jsonString( comment ), ',"link":', _jsonString( link ), ',"path":[', path, ']}' ) )
+
+class RogetThesaurusFormatterJSONL:
+    """
+        class for formatting of Roget thesaurus as json lines (one json object per line for each node)
+    """
+    """ the records are collected and written in chunks of this many records """
+    _RECORDS_PER_WRITE = 2048
+    """ gzip level of the compressed export (as in RogetThesaurusFormatterXML) """
+    _COMPRESS_LEVEL = 6
+
+    def show(self, roget, file, root = None, mask = 0xF, compress = False ):
+        """ writes a flat record for each node to file, in preorder; only for the subtree of root if root is set,
+            and only for the nodes with a type in mask. Each record has the fields:
+                id          - the internal id of the node
+                parent      - the internal id of the parent (null for the root)
+                type        - the type of the node (Category, Headword, SenseGroup or Sense)
+                key         - the key of the node
+                index       - the id of a head word (null for other nodes)
+                wordType    - the word type (N, V, Adj, Adv or Phr), or null
+                comment     - the comment, or null
+                link        - the id of the head word that a sense links to, or null
+                path        - the list of internal ids of the parents of the node, starting with the root
+            the parent and the path refer to all nodes of the ontology, also to those that are not written.
+            uses orjson if it is installed (the output is the same). If compress is set then file is a binary file,
+            and the records are written to it as gzip compressed utf-8 """
+        if compress:
+            with gzip.GzipFile( fileobj = file, mode = 'wb', compresslevel = self._COMPRESS_LEVEL ) as out:
+                self._show( roget, out.write, root, mask, True )
+        else:
+            self._show( roget, file.write, root, mask, False )
+
+    def _show(self, roget, write, root, mask, binary ):
+        if root == None:
+            root = roget.rootNode
+
+        if orjson != None:
+            record = _orjsonRecord
+            emptyPath = ()
+            extendPath = lambda path, internalId: path + ( internalId, )
+            def flush( parts ):
+                text = b'\n'.join( parts ) + b'\n'
+                write( text if binary else text.decode() )
+        else:
+            # the records are formatted here, that is about twice as fast as json.dumps of a dictionary for each record
+            record = _jsonRecord
+            emptyPath = ''
+            extendPath = lambda path, internalId: path + ',' + str( internalId ) if path else str( internalId )
+            def flush( parts ):
+                text = '\n'.join( parts ) + '\n'
+                write( text.encode() if binary else text )
+
+        # the internal ids of the parents of root
+        parentIds = []
+        n = root._parent
+        while n != None:
+            parentIds.append( n._internalId )
+            n = n._parent
+        rootPath = emptyPath
+        for internalId in reversed( parentIds ):
+            rootPath = extendPath( rootPath, internalId )
+        rootParent = parentIds[0] if parentIds else None
+
+        parts = []
+        append = parts.append
+        # ( internal id, path of the children ) of the nodes from root down to the parent of the current node;
+        # the path is the same for all children of a node, and is computed once.
+        parents = []
+        leafTypes = _leafTypes( mask )
+
+        for (depth, n) in _iterPreorderDepth( root, 0, leafTypes ):
+            del parents[ depth: ]
+            (parent, path) = parents[-1] if parents else ( rootParent, rootPath )
+            typ = n._type
+            if typ & mask:
+                if typ == ROGET_NODE_SENSE or typ == ROGET_NODE_HEADWORD:
+                    link = n._link
+                    append( record( n._internalId, parent, _NODE_TYPE_NAMES[ typ ], n._key, n._index if typ == ROGET_NODE_HEADWORD else None,
+                                    _WORD_TYPE_NAMES.get( n._wordType ), n._comment if n._comment != '' else None,
+                                    link._index if link != None else None, path ) )
+                else:
+                    append( record( n._internalId, parent, _NODE_TYPE_NAMES[ typ ], n._key, None, None, None, None, path ) )
+                if len( parts ) >= self._RECORDS_PER_WRITE:
+                    flush( parts )
+                    parts.clear()
+            if typ & leafTypes == 0 and n._child:
+                parents.append( ( n._internalId, extendPath( path, n._internalId ) ) )
+
+        if parts:
+            flush( parts )
@@ -0,0 +1,3 @@
+#!/bin/bash -xe
+export PYTHONPATH=`pwd`
+python3 tests/benchmark_roget.py
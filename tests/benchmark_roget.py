@@ -0,0 +1,453 @@
+import re
+import sys
+import time
+import gc
+import io
+import os
+import random
+import tempfile
+import roget
+import gzip
+import json
+import xml.etree.ElementTree
+from test_roget import legacySemanticSimilarity, similarityPairs, recursivePreorder, recursivePostorder
+
+WORD_TYPE_BY_ATTRIBUTE = { 'V.' : roget.WORD_TYPE_VERB, 'N.' : roget.WORD_TYPE_NOUN, 'Adj.' : roget.WORD_TYPE_ADJ,
+                           'Adv.' : roget.WORD_TYPE_ADVERB, 'Phr.' : roget.WORD_TYPE_PHRASE }
+
+_linkRe = re.compile( r'\&amp;c\s+(\([^\)]+\))?\s*([^\s^\,^\;^\.]+)\.?' )
+_commentRe = re.compile(r'\[([^\]]*)\]')
+_attributeRe = re.compile(r'(N\.|Adj\.|Adv\.|V\.|Phr\.)')
+_cleanupRe = re.compile(r'[\^\n]')
+_cleanupRe2 = re.compile(r'\s\s+')
+
+def legacyParseWord( word, text ):
+    """ the word parser before the sense tokenizer was added: a search and sub for each kind of annotation """
+    n = _commentRe.search( text )
+    if n:
+        commentText = n.group(1).strip()
+        if _cleanupRe.search( commentText ):
+            commentText = _cleanupRe.sub( '', commentText )
+        word._comment = commentText.strip()
+        text = _commentRe.sub( '', text )
+    n = _linkRe.search( text )
+    if n:
+        attribValue = n.group(1)
+        linkValue = n.group(2)
+        if attribValue == None:
+            attribValue = linkValue
+            linkValue = None
+        lowerAttrib = attribValue.lower()
+        if lowerAttrib == 'adj' or  lowerAttrib == 'adj.':
+            word._wordType = roget.WORD_TYPE_ADJ
+        elif lowerAttrib == 'v' or lowerAttrib == 'v.':
+            word._wordType = roget.WORD_TYPE_VERB
+        elif lowerAttrib == 'adv' or lowerAttrib == 'adv.':
+            word._wordType  = roget.WORD_TYPE_ADVERB
+        elif lowerAttrib == 'n':
+            word._wordType = roget.WORD_TYPE_NOUN
+        elif lowerAttrib == 'phr':
+            word._wordType = roget.WORD_TYPE_PHRASE
+        elif lowerAttrib[0].isdigit():
+            linkValue = lowerAttrib
+        if linkValue != None:
+            word._link = linkValue.strip()
+        text = _linkRe.sub( '', text)
+    n = _attributeRe.search( text )
+    if n:
+        word._wordType = WORD_TYPE_BY_ATTRIBUTE[ n.group(1) ]
+        text = _attributeRe.sub( '', text )
+    if _cleanupRe.search( text ):
+        text = _cleanupRe.sub( ' ', text )
+    if _cleanupRe2.search( text ):
+        text = _cleanupRe2.sub( ' ', text )
+    word._key = text.strip()
+
+class RecordingBuilder( roget.RogetBuilder ):
+    """ records the text of each word that is passed to the word parser """
+    def __init__(self):
+        roget.RogetBuilder.__init__( self )
+        self.texts = []
+
+    def _parseWord(self, word, text ):
+        self.texts.append( text )
+        roget.RogetBuilder._parseWord( self, word, text )
+
+def wordFields( word ):
+    return ( word._key, word._comment, word._link, word._wordType )
+
+def bench_word_parsing():
+    print(' *** benchmark word parsing *** ')
+    recorder = RecordingBuilder()
+    recorder.parse()
+    texts = recorder.texts
+
+    builder = roget.RogetBuilder()
+    legacyWords = [ roget.Sense( roget.ROGET_NODE_SENSE, None ) for _ in texts ]
+    words = [ roget.Sense( roget.ROGET_NODE_SENSE, None ) for _ in texts ]
+
+    tm = time.perf_counter()
+    for (word, text) in zip( legacyWords, texts ):
+        legacyParseWord( word, text )
+    legacyTime = time.perf_counter() - tm
+
+    tm = time.perf_counter()
+    for (word, text) in zip( words, texts ):
+        builder._parseWord( word, text )
+    tokenizerTime = time.perf_counter() - tm
+
+    for (legacy, word, text) in zip( legacyWords, words, texts ):
+        assert wordFields( legacy ) == wordFields( word ), "different result for: " + repr( text )
+
+    print("words: ", len( texts ))
+    print("per word before (search + sub per annotation): %.2f usec" % ( legacyTime * 1e6 / len( texts ) ))
+    print("per word after (sense tokenizer): %.2f usec" % ( tokenizerTime * 1e6 / len( texts ) ))
+
+def bench_parse():
+    print(' *** benchmark parse *** ')
+    tm = time.perf_counter()
+    roget.RogetBuilder().parse()
+    print("time to parse: %.3f sec" % ( time.perf_counter() - tm ))
+
+def bench_arrays():
+    print(' *** benchmark arrays *** ')
+    thesaurus = roget.RogetBuilder().parse()
+    classes = thesaurus.rootNode.child
+
+    tm = time.perf_counter()
+    depths = []
+    for n in roget.roget_parser._iterPreorder( thesaurus.rootNode ):
+        depth = 0
+        while n.parent != None:
+            depth += 1
+            n = n.parent
+        depths.append( depth )
+    sensesPerClass = [ [ n for n in roget.roget_parser._iterPreorder( c ) if n.type == roget.ROGET_NODE_SENSE ] for c in classes ]
+    nodeTime = time.perf_counter() - tm
+
+    tm = time.perf_counter()
+    arrays = roget.RogetThesaurusArrays.fromThesaurus( thesaurus )
+    buildTime = time.perf_counter() - tm
+
+    tm = time.perf_counter()
+    arrayDepths = arrays.depths()
+    arraySenses = [ arrays.sensesUnder( c.internalId - 1 ) for c in classes ]
+    arrayTime = time.perf_counter() - tm
+
+    assert list( arrayDepths ) == depths
+    assert [ len( s ) for s in arraySenses ] == [ len( s ) for s in sensesPerClass ]
+
+    print("numpy: ", roget.roget_parser.numpy != None)
+    print("depths and senses per class with nodes: %.3f sec" % nodeTime)
+    print("depths and senses per class with arrays: %.3f sec (building the arrays: %.3f sec)" % ( arrayTime, buildTime ))
+
+def bench_similarity():
+    print(' *** benchmark similarity *** ')
+    thesaurus = roget.RogetBuilder().parse()
+    pairs = similarityPairs( thesaurus, 20000 )
+    # signatures are computed on each call (see bench_similarity_cache)
+    thesaurus.setCacheSize( 0 )
+
+    # each measurement starts after a full collection, so that none of them pays for the garbage of the others
+    gc.collect()
+    tm = time.perf_counter()
+    legacy = [ legacySemanticSimilarity( thesaurus, w1, w2 ) for (w1, w2) in pairs ]
+    legacyTime = time.perf_counter() - tm
+
+    gc.collect()
+    tm = time.perf_counter()
+    signatures = [ thesaurus.semanticSimilarity( w1, w2 ) for (w1, w2) in pairs ]
+    signatureTime = time.perf_counter() - tm
+
+    gc.collect()
+    tm = time.perf_counter()
+    thesaurus.precomputeSimilarity()
+    precomputeTime = time.perf_counter() - tm
+
+    gc.collect()
+    tm = time.perf_counter()
+    precomputed = [ thesaurus.semanticSimilarity( w1, w2 ) for (w1, w2) in pairs ]
+    precomputedTime = time.perf_counter() - tm
+
+    assert legacy == signatures == precomputed
+
+    print("pairs: ", len( pairs ))
+    print("pairs per second before (sorted ancestor lists): %.0f" % ( len( pairs ) / legacyTime ))
+    print("pairs per second with signatures: %.0f" % ( len( pairs ) / signatureTime ))
+    print("pairs per second with precomputed signatures: %.0f (time to precompute: %.3f sec)" % ( len( pairs ) / precomputedTime, precomputeTime ))
+
+def bench_similarity_batch():
+    print(' *** benchmark similarity batch *** ')
+    thesaurus = roget.RogetBuilder().parse()
+    # a workload where the same words repeat: pairs of a vocabulary of 400 words
+    words = sorted( set( w for pair in similarityPairs( thesaurus, 400 ) for w in pair ) )[ : 400 ]
+    rand = random.Random( 1 )
+    pairs = [ ( rand.choice( words ), rand.choice( words ) ) for _ in range( 100000 ) ]
+
+    gc.collect()
+    tm = time.perf_counter()
+    loop = [ thesaurus.semanticSimilarity( w1, w2 )[0] for (w1, w2) in pairs ]
+    loopTime = time.perf_counter() - tm
+
+    gc.collect()
+    tm = time.perf_counter()
+    (scores, _) = thesaurus.semanticSimilarityBatch( pairs )
+    batchTime = time.perf_counter() - tm
+
+    gc.collect()
+    tm = time.perf_counter()
+    (matrix, _) = thesaurus.similarityMatrix( words, words )
+    matrixTime = time.perf_counter() - tm
+
+    assert list( scores ) == loop
+    assert [ matrix[ words.index( w1 ) ][ words.index( w2 ) ] for (w1, w2) in pairs[ : 1000 ] ] == loop[ : 1000 ]
+
+    print("pairs: ", len( pairs ), " words: ", len( words ))
+    print("pairs per second with semanticSimilarity in a loop: %.0f" % ( len( pairs ) / loopTime ))
+    print("pairs per second with semanticSimilarityBatch: %.0f" % ( len( pairs ) / batchTime ))
+    print("pairs per second with similarityMatrix (%d x %d): %.0f" % ( len( words ), len( words ), len( words ) ** 2 / matrixTime ))
+
+def bench_similarity_cache():
+    print(' *** benchmark similarity cache *** ')
+    thesaurus = roget.RogetBuilder().parse()
+    # a hot vocabulary of 400 words
+    words = sorted( set( w for pair in similarityPairs( thesaurus, 400 ) for w in pair ) )[ : 400 ]
+    rand = random.Random( 1 )
+    pairs = [ ( rand.choice( words ), rand.choice( words ) ) for _ in range( 50000 ) ]
+
+    thesaurus.setCacheSize( 0 )
+    gc.collect()
+    tm = time.perf_counter()
+    uncached = [ thesaurus.semanticSimilarity( w1, w2 ) for (w1, w2) in pairs ]
+    uncachedTime = time.perf_counter() - tm
+
+    thesaurus.setCacheSize( 1000 )
+    gc.collect()
+    tm = time.perf_counter()
+    cached = [ thesaurus.semanticSimilarity( w1, w2 ) for (w1, w2) in pairs ]
+    cachedTime = time.perf_counter() - tm
+
+    assert cached == uncached
+    (hits, misses, _, _) = thesaurus.cacheInfo()
+    print("pairs per second without cache: %.0f" % ( len( pairs ) / uncachedTime ))
+    print("pairs per second with cache: %.0f (hits: %d misses: %d)" % ( len( pairs ) / cachedTime, hits, misses ))
+
+class RecursiveFormatterText( roget.RogetThesaususFormatterText ):
+    """ the text formatter before the traversal without recursion """
+    def _showRogetTextImp(self, node, depth, file, mask ):
+        if node.type & mask != 0:
+            line = ''
+            for _ in range(1,depth):
+                line += '\t'
+            line += node.toString() + '\n'
+            file.write( line )
+        for n  in node.child:
+            self._showRogetTextImp(n , depth + 1, file, mask )
+
+def timeFormatter( thesaurus, formatter ):
+    out = io.StringIO()
+    gc.collect()
+    tm = time.perf_counter()
+    formatter.show( thesaurus, out )
+    return ( time.perf_counter() - tm, out.getvalue() )
+
+def bench_traversal():
+    print(' *** benchmark traversal *** ')
+    thesaurus = roget.RogetBuilder().parse()
+    root = thesaurus.rootNode
+
+    gc.collect()
+    tm = time.perf_counter()
+    recursive = recursivePreorder( root, 0, [] )
+    recursivePostorder( root, [] )
+    recursiveTime = time.perf_counter() - tm
+
+    gc.collect()
+    tm = time.perf_counter()
+    iterative = list( roget.roget_parser._iterPreorderDepth( root ) )
+    list( roget.roget_parser._iterPostorder( root ) )
+    iterativeTime = time.perf_counter() - tm
+    assert recursive == iterative
+
+    print("nodes: ", len( iterative ))
+    print("preorder and postorder walk, recursive: %.3f sec with an explicit stack: %.3f sec" % ( recursiveTime, iterativeTime ))
+    (recursiveTime, recursiveOut) = timeFormatter( thesaurus, RecursiveFormatterText() )
+    (iterativeTime, iterativeOut) = timeFormatter( thesaurus, roget.RogetThesaususFormatterText() )
+    assert recursiveOut == iterativeOut
+    print("text formatter, recursive: %.3f sec with an explicit stack: %.3f sec" % ( recursiveTime, iterativeTime ))
+
+class CountingFileIO( io.FileIO ):
+    """ counts the writes to the file (each one is a system call) """
+    def __init__(self, name ):
+        io.FileIO.__init__( self, name, 'w' )
+        self.writes = 0
+
+    def write(self, b ):
+        self.writes += 1
+        return io.FileIO.write( self, b )
+
+class CountingFile:
+    """ counts the calls of write of a text file """
+    def __init__(self, file ):
+        self._file = file
+        self.writes = 0
+
+    def write(self, s ):
+        self.writes += 1
+        return self._file.write( s )
+
+def exportText( thesaurus, formatter, fileName, mask ):
+    """ writes the output of formatter to fileName; returns the time, the calls of write and the writes to the file """
+    raw = CountingFileIO( fileName )
+    with io.TextIOWrapper( io.BufferedWriter( raw ) ) as f:
+        out = CountingFile( f )
+        gc.collect()
+        tm = time.perf_counter()
+        if mask == None:
+            formatter.show( thesaurus, out )
+        else:
+            formatter.show( thesaurus, out, mask )
+        f.flush()
+        return ( time.perf_counter() - tm, out.writes, raw.writes )
+
+def bench_text_export():
+    print(' *** benchmark text export *** ')
+    thesaurus = roget.RogetBuilder().parse()
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for mask in [ 0xF, roget.ROGET_NODE_CATEGORY | roget.ROGET_NODE_HEADWORD ]:
+            results = []
+            for formatter in [ RecursiveFormatterText(), roget.RogetThesaususFormatterText() ]:
+                fileName = os.path.join( tmpDir, 'roget-out-' + str( len( results ) ) )
+                results.append( exportText( thesaurus, formatter, fileName, mask ) )
+                with open( fileName ) as f:
+                    results[-1] += ( f.read(), )
+            assert results[0][3] == results[1][3]
+            for (name, (exportTime, writes, systemWrites, _)) in zip( [ 'one write per node', 'buffered' ], results ):
+                print("text export of mask %d, %s: %.3f sec, calls of write: %d, writes to the file: %d" % ( mask, name, exportTime, writes, systemWrites ))
+
+def legacyEscapeStr( s ):
+    s = s.replace("<", "&lt;")
+    s = s.replace(">", "&gt;")
+    s = s.replace("\"", "&quot;")
+    return s
+
+class LegacyFormatterXML:
+    """ the xml formatter before the streaming export: one write per tag, a blank after each element """
+    def show(self, roget, file):
+        file.write( "<?xml version='1.0'?>\n<rogetThesaurus>\n<ontology>" )
+        self._showRogetXMLNodes( roget.rootNode, file )
+        file.write( "</ontology>" )
+        file.write( "</rogetThesaurus>" )
+
+    def _showRogetXMLNodes( self, node, file ):
+        txt = "<" + node.typeToString() + " "
+        if node.type == roget.ROGET_NODE_CATEGORY:
+            txt += 'name="' + legacyEscapeStr( node.key ) + '"'
+        elif node.type == roget.ROGET_NODE_SENSE or node.type == roget.ROGET_NODE_HEADWORD:
+            if node.type == roget.ROGET_NODE_HEADWORD:
+                txt += 'id="' + legacyEscapeStr( node.index ) + '" '
+            txt += 'sense="' + legacyEscapeStr( node.key ) + '" '
+            if node.wordType != roget.WORD_TYPE_NONE:
+                txt += ' wordType="'
+                if node.wordType ==  roget.WORD_TYPE_ADJ:
+                    txt += 'Adj'
+                if node.wordType ==  roget.WORD_TYPE_VERB:
+                    txt += 'V'
+                if node.wordType ==  roget.WORD_TYPE_ADVERB:
+                    txt += 'Adv'
+                if node.wordType ==  roget.WORD_TYPE_NOUN:
+                    txt += 'N'
+                if node.wordType ==  roget.WORD_TYPE_PHRASE:
+                    txt += 'Phr'
+                txt += '" '
+            if node.comment != '':
+                txt += ' comment="' + legacyEscapeStr( node.comment ) + '" '
+            if node.link != None:
+                txt += ' link="' + legacyEscapeStr( node.link.index ) + '" '
+                if node.link.key != None:
+                    txt  += ' linkComment="' + legacyEscapeStr( node.link.key )+ '" '
+        txt += ">"
+        file.write( txt + '\n' )
+        for n  in node.child:
+            self._showRogetXMLNodes( n, file )
+            file.write( " " )
+        file.write( "</" + node.typeToString() + ">" )
+
+def bench_xml_export():
+    print(' *** benchmark xml export *** ')
+    thesaurus = roget.RogetBuilder().parse()
+    with tempfile.TemporaryDirectory() as tmpDir:
+        results = []
+        for formatter in [ LegacyFormatterXML(), roget.RogetThesaurusFormatterXML() ]:
+            fileName = os.path.join( tmpDir, 'roget-out-' + str( len( results ) ) )
+            results.append( exportText( thesaurus, formatter, fileName, None ) )
+            with open( fileName ) as f:
+                results[-1] += ( xml.etree.ElementTree.fromstring( f.read() ), )
+        for (name, (exportTime, writes, systemWrites, _)) in zip( [ 'before', 'streaming' ], results ):
+            print("xml export %s: %.3f sec, calls of write: %d, writes to the file: %d" % ( name, exportTime, writes, systemWrites ))
+
+        # the same elements, apart from the white space between them and the three comments with a tab,
+        # that the old export did not escape: the xml parser read these tabs as blanks.
+        (before, after) = [ [ ( e.tag, { k : v.replace( '\t', ' ' ) for (k, v) in e.attrib.items() } ) for e in r[3].iter() ] for r in results ]
+        assert before == after and len( after ) == len( list( thesaurus.iterNodes() ) ) + 2
+
+        fileName = os.path.join( tmpDir, 'roget-out.xml.gz' )
+        with open( fileName, 'wb' ) as f:
+            gc.collect()
+            tm = time.perf_counter()
+            roget.RogetThesaurusFormatterXML().show( thesaurus, f, compress = True )
+            compressTime = time.perf_counter() - tm
+        with gzip.open( fileName ) as f:
+            xml.etree.ElementTree.parse( f )
+        print("xml export with gzip: %.3f sec, size: %d bytes" % ( compressTime, os.path.getsize( fileName ) ))
+
+def bench_jsonl_export():
+    print(' *** benchmark jsonl export *** ')
+    thesaurus = roget.RogetBuilder().parse()
+    parser = sys.modules[ 'roget.roget_parser' ]
+    orjson = parser.orjson
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-out' )
+        (exportTime, writes, _) = exportText( thesaurus, roget.RogetThesaurusFormatterXML(), fileName, None )
+        gc.collect()
+        tm = time.perf_counter()
+        nodes = sum( 1 for _ in xml.etree.ElementTree.parse( fileName ).iter() ) - 2
+        print("xml: export %.3f sec, reading the nodes back with xml.etree: %.3f sec (%d nodes)" % ( exportTime, time.perf_counter() - tm, nodes ))
+
+        results = []
+        for useOrjson in [ False, True ]:
+            if useOrjson and orjson == None:
+                print("orjson is not installed")
+                continue
+            try:
+                parser.orjson = orjson if useOrjson else None
+                (exportTime, writes, _) = exportText( thesaurus, roget.RogetThesaurusFormatterJSONL(), fileName, None )
+            finally:
+                parser.orjson = orjson
+            # the records are read back by the same library that wrote them
+            loads = orjson.loads if useOrjson else json.loads
+            gc.collect()
+            tm = time.perf_counter()
+            with open( fileName, 'rb' ) as f:
+                records = [ loads( line ) for line in f ]
+            assert len( records ) == nodes
+            with open( fileName ) as f:
+                results.append( f.read() )
+            print("json lines%s: export %.3f sec, calls of write: %d, reading the records back: %.3f sec" %
+                  ( " with orjson" if useOrjson else "", exportTime, writes, time.perf_counter() - tm ))
+        assert len( set( results ) ) == 1
+
+def main():
+    bench_word_parsing()
+    bench_parse()
+    bench_arrays()
+    bench_similarity()
+    bench_similarity_batch()
+    bench_similarity_cache()
+    bench_traversal()
+    bench_text_export()
+    bench_xml_export()
+    bench_jsonl_export()
+
+if __name__ == "__main__":
+    main()
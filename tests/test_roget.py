@@ -1,3 +1,21 @@
+import os
+import sys
+import io
+import time
+import tempfile
+import shutil
+import itertools
+import gzip
+import pickle
+import copy
+import json
+import xml.etree.ElementTree
+import random
+import hashlib
+import gc
+import tracemalloc
+import concurrent.futures
+import subprocess
 import roget
 
 
@@ -60,6 +78,1097 @@ def test_similarity( rogetThesaurus):
     test_sim( rogetThesaurus, 'being', 'commit' )
 
 
+def formatText( rogetThesaurus, mask = 0xF ):
+    out = io.StringIO()
+    roget.RogetThesaususFormatterText().show( rogetThesaurus, out, mask )
+    return out.getvalue()
+
+# sha256 of the text report of the full thesaurus, of the categories and of categories with head words
+GOLDEN_TEXT_REPORT = {
+    0xF : 'd81eed9caa6f5c789af40a1a815057b71cb744e115230303710f424df1449e8b',
+    roget.ROGET_NODE_CATEGORY : '6f8976149fefa1fd0bc0afcf9b42bffb49d29c3973a6a8a59d19820249c5fd9d',
+    roget.ROGET_NODE_CATEGORY | roget.ROGET_NODE_HEADWORD : 'b7bc30a25d33276a5696570a9a67ff3784d399bb2f6095e1ef20964c4a8e7c52',
+}
+
+def test_golden( rogetThesaurus ):
+    print(' *** test golden output *** ')
+    for mask in GOLDEN_TEXT_REPORT:
+        digest = hashlib.sha256( formatText( rogetThesaurus, mask ).encode('utf-8') ).hexdigest()
+        assert digest == GOLDEN_TEXT_REPORT[ mask ], "text report differs for mask " + str( mask )
+
+    # all combinations of node types: one line for each visited node, indented by its depth
+    nodes = recursivePreorder( rogetThesaurus.rootNode, 0, [] )
+    for mask in range( 1, 0x10 ):
+        assert formatText( rogetThesaurus, mask ) == ''.join( '\t' * d + n.toString() + '\n' for (d, n) in nodes if n.type & mask ), mask
+
+def test_snapshot( rogetThesaurus ):
+    print(' *** test snapshot *** ')
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-binary' )
+
+        parser = roget.RogetBuilder()
+        tm = time.time()
+        parser.store( rogetThesaurus, fileName )
+        print("time to store snapshot: ", time.time() - tm)
+
+        tm = time.time()
+        loaded = parser.load( fileName )
+        print("time to load snapshot: ", time.time() - tm)
+
+    assert formatText( loaded ) == formatText( rogetThesaurus )
+    assert len( loaded.headWordIndex ) == len( rogetThesaurus.headWordIndex )
+    assert len( loaded.senseIndex ) == len( rogetThesaurus.senseIndex )
+    for word in [ 'fact', 'love', 'at the very moment' ]:
+        assert [ s.toString() for s in loaded.senseIndex[ word ] ] == [ s.toString() for s in rogetThesaurus.senseIndex[ word ] ]
+    assert loaded.semanticSimilarity( 'being', 'entity' )[0] == rogetThesaurus.semanticSimilarity( 'being', 'entity' )[0]
+    assert loaded.headWordIndex[ '124' ].key == rogetThesaurus.headWordIndex[ '124' ].key
+    assert similarityResults( loaded ) == similarityResults( rogetThesaurus )
+
+def test_mapped_snapshot( rogetThesaurus ):
+    print(' *** test mapped snapshot *** ')
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-binary' )
+
+        parser = roget.RogetBuilder()
+        parser.store( rogetThesaurus, fileName )
+
+        tm = time.time()
+        mapped = parser.load( fileName, mapped = True )
+        print("time to map snapshot: ", time.time() - tm)
+
+        assert formatText( mapped ) == formatText( rogetThesaurus )
+        assert len( mapped.headWordIndex ) == len( rogetThesaurus.headWordIndex )
+        assert len( mapped.senseIndex ) == len( rogetThesaurus.senseIndex )
+        assert sorted( mapped.senseIndex ) == list( mapped.senseIndex )
+        assert 'fact' in mapped.senseIndex and not 'no such word' in mapped.senseIndex
+        for word in [ 'fact', 'love', 'at the very moment' ]:
+            assert [ s.toString() for s in mapped.senseIndex[ word ] ] == [ s.toString() for s in rogetThesaurus.senseIndex[ word ] ]
+        assert mapped.headWordIndex[ '124' ].toString() == rogetThesaurus.headWordIndex[ '124' ].toString()
+        assert mapped.headWordIndex[ '124' ] in mapped.headWordIndex[ '123' ].parent.child
+        (score, node) = mapped.semanticSimilarity( 'at the very moment', 'just then' )
+        assert ( score, node.toString() ) == ( 90, rogetThesaurus.semanticSimilarity( 'at the very moment', 'just then' )[1].toString() )
+        assert similarityResults( mapped ) == similarityResults( rogetThesaurus )
+
+        # the snapshot is replaced and not overwritten: a mapped copy stays valid while the file is stored again
+        words = [ s.toString() for s in mapped.lookup( 'love' ) ]
+        root = roget.RogetNode( roget.ROGET_NODE_CATEGORY, 'root' )
+        sense = roget.Sense( roget.ROGET_NODE_SENSE, root )
+        sense._key = 'love'
+        parser.store( roget.RogetThesaurus( root, {}, { sense.key : [ sense ] } ), fileName )
+        assert [ s.toString() for s in mapped.lookup( 'love' ) ] == words
+        assert len( parser.load( fileName, mapped = True ).lookup( 'love' ) ) == 1
+        os.remove( fileName )
+        parser.load( fileName, mapped = True )
+        assert [ s.toString() for s in mapped.lookup( 'love' ) ] == words
+        assert os.listdir( tmpDir ) == [ 'roget-binary' ]
+
+def indexSizes( rogetThesaurus ):
+    return ( len( rogetThesaurus.headWordIndex ), len( rogetThesaurus.senseIndex ),
+             sum( len( senses ) for senses in rogetThesaurus.senseIndex.values() ) )
+
+def test_parse_twice( rogetThesaurus ):
+    print(' *** test parse twice *** ')
+    parser = roget.RogetBuilder()
+    tracemalloc.start()
+    try:
+        gc.collect()
+        retainedBefore = tracemalloc.get_traced_memory()[0]
+
+        first = parser.parse()
+        firstSizes = indexSizes( first )
+        first = None
+        gc.collect()
+        retainedFirst = tracemalloc.get_traced_memory()[0]
+
+        second = parser.parse()
+        secondSizes = indexSizes( second )
+        second = None
+        gc.collect()
+        retainedSecond = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    print("memory retained after first parse: ", retainedFirst - retainedBefore, " after second parse: ", retainedSecond - retainedBefore)
+    assert firstSizes == secondSizes == indexSizes( rogetThesaurus )
+    assert retainedFirst - retainedBefore < 1024 * 1024
+    assert retainedSecond - retainedBefore < 1024 * 1024
+
+    # a thesaurus is not changed by the next parse
+    third = parser.parse()
+    assert indexSizes( third ) == indexSizes( rogetThesaurus )
+    assert len( third.senseIndex[ 'fact' ] ) == len( rogetThesaurus.senseIndex[ 'fact' ] )
+
+def similarityResults( rogetThesaurus ):
+    ret = []
+    for (w1, w2) in [ ('being', 'entity'), ('fact', 'being'), ('at the very moment', 'just then'), ('being', 'nihility') ]:
+        (score, node) = rogetThesaurus.semanticSimilarity( w1, w2 )
+        ret.append( ( score, node.internalId if node != None else None ) )
+    return ret
+
+def legacyAncestors( rogetThesaurus, word ):
+    """ the ancestor list of the original semanticSimilarity: the parents of each sense (and of its link) up to the first category, sorted by internal id """
+    ret = []
+    for s in rogetThesaurus.senseIndex[ word ]:
+        for n in [ s, s.link ]:
+            while n != None:
+                ret.append( n )
+                if n.type == roget.ROGET_NODE_CATEGORY:
+                    break
+                n = n.parent
+    ret.sort( key = lambda elm: elm.internalId )
+    return ret
+
+def legacySemanticSimilarity( rogetThesaurus, seq1, seq2 ):
+    """ the original semanticSimilarity: merges the sorted ancestor lists of both words """
+    arr1 = legacyAncestors( rogetThesaurus, seq1 )
+    arr2 = legacyAncestors( rogetThesaurus, seq2 )
+    score = 0
+    rnode = None
+    pos1 = 0
+    pos2 = 0
+    nscore = 0
+    while pos1 < len( arr1 ) and pos2 < len( arr2 ):
+        if arr1[ pos1 ].internalId == arr2[ pos2 ].internalId:
+            node = arr1[ pos1 ]
+            if node.type == roget.ROGET_NODE_CATEGORY:
+                nscore = 80
+            elif node.type == roget.ROGET_NODE_HEADWORD:
+                nscore = 90
+            elif node.type == roget.ROGET_NODE_SENSE_GROUP:
+                nscore = 100
+            if score < nscore:
+                score = nscore
+                rnode = node
+                if score == 100:
+                    break
+            pos1 += 1
+            pos2 += 1
+        elif arr1[ pos1 ].internalId < arr2[ pos2 ].internalId:
+            pos1 += 1
+        else:
+            pos2 += 1
+    return (score, rnode)
+
+def similarityPairs( rogetThesaurus, count ):
+    """ pairs of words that are likely to be related: the senses of random head words, and some random words """
+    rand = random.Random( 1 )
+    words = sorted( rogetThesaurus.senseIndex )
+    headWords = sorted( rogetThesaurus.headWordIndex )
+    pairs = []
+    while len( pairs ) < count:
+        related = [ n.key for n in roget.roget_parser._iterPreorder( rogetThesaurus.headWordIndex[ rand.choice( headWords ) ] ) if n.key != '' ]
+        pairs.append( ( rand.choice( related ), rand.choice( related ) ) )
+        pairs.append( ( rand.choice( related ), rand.choice( words ) ) )
+    return pairs[ : count ]
+
+def test_similarity_signatures( rogetThesaurus ):
+    print(' *** test similarity signatures *** ')
+    pairs = similarityPairs( rogetThesaurus, 4000 ) + [ ( w, w ) for w in [ 'fact', 'being', 'set' ] ]
+    expected = [ legacySemanticSimilarity( rogetThesaurus, w1, w2 ) for (w1, w2) in pairs ]
+    assert set( score for (score, _) in expected ) == set( [ 0, 80, 90, 100 ] )
+    assert [ rogetThesaurus.semanticSimilarity( w1, w2 ) for (w1, w2) in pairs ] == expected
+
+    precomputed = roget.RogetBuilder().parse()
+    precomputed.precomputeSimilarity()
+    result = [ precomputed.semanticSimilarity( w1, w2 ) for (w1, w2) in pairs ]
+    assert [ ( score, node.internalId if node != None else None ) for (score, node) in result ] == \
+           [ ( score, node.internalId if node != None else None ) for (score, node) in expected ]
+
+def test_similarity_batch( rogetThesaurus ):
+    print(' *** test similarity batch *** ')
+    pairs = similarityPairs( rogetThesaurus, 2000 )
+    pairs += pairs[ : 100 ]
+    def scoreAndId( w1, w2 ):
+        (score, node) = rogetThesaurus.semanticSimilarity( w1, w2 )
+        return ( score, node.internalId if node != None else 0 )
+
+    expected = [ scoreAndId( w1, w2 ) for (w1, w2) in pairs ]
+    expected = ( [ score for (score, _) in expected ], [ nodeId for (_, nodeId) in expected ] )
+
+    wordsA = [ w1 for (w1, _) in pairs[ : 60 ] ]
+    wordsB = [ w2 for (_, w2) in pairs[ : 40 ] ] + [ 'fact' ]
+    expectedMatrix = [ [ scoreAndId( a, b ) for b in wordsB ] for a in wordsA ]
+    expectedMatrix = ( [ [ score for (score, _) in row ] for row in expectedMatrix ], [ [ nodeId for (_, nodeId) in row ] for row in expectedMatrix ] )
+
+    numpy = roget.roget_parser.numpy
+    for useNumPy in [ True, False ]:
+        if not useNumPy:
+            roget.roget_parser.numpy = None
+        try:
+            (scores, nodeIds) = rogetThesaurus.semanticSimilarityBatch( iter( pairs ) )
+            assert ( list( scores ), list( nodeIds ) ) == expected
+            # the pairs can be lists (as read from json, for example)
+            (scores, nodeIds) = rogetThesaurus.semanticSimilarityBatch( [ list( pair ) for pair in pairs ] )
+            assert ( list( scores ), list( nodeIds ) ) == expected
+            (scores, nodeIds) = rogetThesaurus.similarityMatrix( wordsA, wordsB )
+            assert [ list( row ) for row in scores ] == expectedMatrix[0]
+            assert [ list( row ) for row in nodeIds ] == expectedMatrix[1]
+            assert [ list( row ) for row in rogetThesaurus.similarityMatrix( wordsA, [] )[0] ] == [ [] ] * len( wordsA )
+        finally:
+            roget.roget_parser.numpy = numpy
+
+def test_similarity_cache( rogetThesaurus ):
+    print(' *** test similarity cache *** ')
+    thesaurus = roget.RogetBuilder().parse()
+    assert thesaurus.cacheInfo() == ( 0, 0, 4096, 0 )
+
+    thesaurus.semanticSimilarity( 'being', 'entity' )
+    thesaurus.semanticSimilarity( 'being', 'fact' )
+    assert thesaurus.cacheInfo() == ( 1, 3, 4096, 3 )
+
+    ancestors = thesaurus.ancestors( 'being' )
+    assert isinstance( ancestors, tuple )
+    assert ancestors == thesaurus.ancestors( 'being' )
+    assert thesaurus.semanticSimilarity( 'being', 'entity' )[1] in ancestors
+    assert [ n.type for n in ancestors ] == sorted( [ n.type for n in ancestors ], key = [ roget.ROGET_NODE_SENSE_GROUP, roget.ROGET_NODE_HEADWORD, roget.ROGET_NODE_CATEGORY ].index )
+
+    # least recently used words are dropped first
+    thesaurus.setCacheSize( 2 )
+    assert thesaurus.cacheInfo()[2:] == ( 2, 2 )
+    thesaurus.ancestors( 'being' )
+    thesaurus.ancestors( 'love' )
+    (hits, misses, _, _) = thesaurus.cacheInfo()
+    thesaurus.ancestors( 'being' )
+    thesaurus.ancestors( 'fact' )
+    assert thesaurus.cacheInfo() == ( hits + 1, misses + 1, 2, 2 )
+
+    thesaurus.clearCache()
+    assert thesaurus.cacheInfo() == ( 0, 0, 2, 0 )
+    thesaurus.setCacheSize( 0 )
+    thesaurus.semanticSimilarity( 'being', 'entity' )
+    assert thesaurus.cacheInfo() == ( 0, 0, 0, 0 )
+
+    pairs = similarityPairs( rogetThesaurus, 500 )
+    thesaurus.setCacheSize( 100 )
+    assert [ thesaurus.semanticSimilarity( w1, w2 )[0] for (w1, w2) in pairs ] == [ rogetThesaurus.semanticSimilarity( w1, w2 )[0] for (w1, w2) in pairs ]
+    assert thesaurus.cacheInfo()[3] == 100
+
+def test_pickle( rogetThesaurus ):
+    print(' *** test pickle *** ')
+    thesaurus = roget.RogetBuilder().parse()
+    thesaurus.setCacheSize( 100 )
+    thesaurus.semanticSimilarity( 'being', 'entity' )
+
+    # the tree is pickled recursively
+    recursionLimit = sys.getrecursionlimit()
+    sys.setrecursionlimit( max( recursionLimit, 20000 ) )
+    try:
+        tm = time.time()
+        copied = pickle.loads( pickle.dumps( thesaurus ) )
+        print("time to pickle: ", time.time() - tm)
+    finally:
+        sys.setrecursionlimit( recursionLimit )
+
+    # the copy has an empty cache of its own, of the same size
+    assert copied.cacheInfo() == ( 0, 0, 100, 0 )
+    assert formatText( copied ) == formatText( rogetThesaurus )
+    assert similarityResults( copied ) == similarityResults( rogetThesaurus )
+    assert copied.cacheInfo()[1] > 0 and thesaurus.cacheInfo() == ( 0, 2, 100, 2 )
+
+    # (a copy of the whole ontology takes a few seconds)
+    root = roget.RogetNode( roget.ROGET_NODE_CATEGORY, 'root' )
+    sense = roget.Sense( roget.ROGET_NODE_SENSE, roget.RogetNode( roget.ROGET_NODE_SENSE_GROUP, None, root ) )
+    sense._key = 'love'
+    small = roget.RogetThesaurus( root, {}, { sense.key : [ sense ] } )
+    small.semanticSimilarity( 'love', 'love' )
+    copied = copy.deepcopy( small )
+    assert copied.cacheInfo() == ( 0, 0, 4096, 0 ) and small.cacheInfo() == ( 1, 1, 4096, 1 )
+    assert copied.semanticSimilarity( 'love', 'love' )[1] is copied.lookup( 'love' )[0].parent
+
+def lookupResults( rogetThesaurus, words ):
+    ret = []
+    for word in words:
+        senses = rogetThesaurus.lookup( word )
+        ret.append( ( rogetThesaurus.contains( word ), [ n.internalId for n in senses ] if senses != None else None,
+                      rogetThesaurus.semanticSimilarity( word, 'being' )[0], rogetThesaurus.semanticSimilarity( 'being', word )[0] ) )
+    return ret
+
+def test_lookup_api( rogetThesaurus ):
+    print(' *** test lookup api *** ')
+    words = [ 'being', 'entity', 'fact', 'at the very moment', 'no such word', 'Being', '', 'being ' ]
+    expected = lookupResults( rogetThesaurus, words )
+    assert [ contains for (contains, _, _, _) in expected ] == [ True ] * 4 + [ False ] * 4
+    assert expected[4] == ( False, None, 0, 0 )
+    assert rogetThesaurus.semanticSimilarity( 'no such word', 'no such word' ) == (0, None)
+    assert rogetThesaurus.ancestors( 'no such word' ) == ()
+    assert list( rogetThesaurus.semanticSimilarityBatch( [ ( 'being', 'no such word' ), ( 'being', 'entity' ) ] )[0] ) == [ 0, 100 ]
+
+    # unknown words are not cached
+    thesaurus = roget.RogetBuilder().parse()
+    for _ in range( 3 ):
+        thesaurus.semanticSimilarity( 'no such word', 'another missing word' )
+    assert thesaurus.cacheInfo()[3] == 0
+    assert lookupResults( thesaurus, words ) == expected
+    thesaurus.precomputeSimilarity()
+    assert lookupResults( thesaurus, words ) == expected
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-binary' )
+        parser = roget.RogetBuilder()
+        parser.store( rogetThesaurus, fileName )
+        assert lookupResults( parser.load( fileName ), words ) == expected
+        mapped = parser.load( fileName, mapped = True )
+        assert lookupResults( mapped, words ) == expected
+        assert mapped.senseIndex.get( 'no such word' ) == None and mapped.headWordIndex.get( 'no such index' ) == None
+        assert mapped.headWordIndex.get( '124' ).key == rogetThesaurus.headWordIndex[ '124' ].key
+        assert all( mapped.contains( word ) for word in rogetThesaurus.senseIndex )
+
+        tm = time.time()
+        for _ in range( 10000 ):
+            mapped.contains( 'no such word' )
+        print("time for 10000 misses in a mapped snapshot: ", time.time() - tm)
+
+def test_normalized_index( rogetThesaurus ):
+    print(' *** test normalized index *** ')
+    thesaurus = roget.RogetBuilder().parse( normalizedIndex = True )
+    assert thesaurus.normalizedIndex != None and rogetThesaurus.normalizedIndex == None
+    for word in [ 'Love', 'love ', 'loves', 'LOVED', ' loving\n' ]:
+        assert 'love' in thesaurus.lookupNormalized( word )
+    assert 'existence' in thesaurus.lookupNormalized( 'Existences' )
+    assert 'extraordinary.' in thesaurus.lookupNormalized( 'extraordinary' )
+    assert thesaurus.lookupNormalized( 'At  the very Moment' ) == ( 'at the very moment', )
+    assert thesaurus.lookupNormalized( 'no such words' ) == ()
+
+    # inflections find their base word, but words that differ only by a suffix or a final e are kept apart
+    assert 'free' in thesaurus.lookupNormalized( 'freed' ) and 'freed' in thesaurus.lookupNormalized( 'free' )
+    assert 'approve' in thesaurus.lookupNormalized( 'approving' ) and 'stop' in thesaurus.lookupNormalized( 'stopping' )
+    assert 'hope' in thesaurus.lookupNormalized( 'hoping' ) and 'hope' in thesaurus.lookupNormalized( 'hopes' )
+    assert not 'Runes' in thesaurus.lookupNormalized( 'run' ) and not 'runes' in thesaurus.lookupNormalized( 'running' )
+    assert not 'hope' in thesaurus.lookupNormalized( 'hop' ) and not 'Hope' in thesaurus.lookupNormalized( 'hop' )
+    lemma = roget.roget_parser._lemma
+    for words in [ 'love loves loved loving', 'hop hops hopped hopping', 'hope hopes hoped hoping', 'run runs running', 'rune runes',
+                   'free frees freed freeing', 'speed speeds speeding', 'approve approves approved approving', 'try tries tried trying',
+                   'stop stops stopped stopping', 'call calls called calling', 'miss misses missed missing', 'thing things' ]:
+        assert len( set( lemma( word ) for word in words.split() ) ) == 1, words
+    assert len( set( lemma( word ) for word in [ 'hop', 'hope', 'run', 'rune', 'thing', 'the' ] ) ) == 6
+
+    # each key of the sense index is found by its own normalized form, except for the keys of punctuation only
+    punctuation = [ key for key in thesaurus.senseIndex if key.strip( roget.roget_parser._NORMALIZE_STRIP ) == '' ]
+    assert '.' in punctuation and '"( )"' in punctuation
+    for key in thesaurus.senseIndex:
+        assert ( key in thesaurus.lookupNormalized( key ) ) == ( not key in punctuation )
+    assert sum( len( keys ) for keys in thesaurus.normalizedIndex.values() ) == len( thesaurus.senseIndex ) - len( punctuation )
+    assert not '' in thesaurus.normalizedIndex
+    for word in [ '', '   ', '?!', '"', '"( )"', '.' ]:
+        assert thesaurus.lookupNormalized( word ) == ()
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-binary' )
+        parser = roget.RogetBuilder()
+        parser.store( rogetThesaurus, fileName )
+        mapped = parser.load( fileName, mapped = True, normalizedIndex = True )
+        assert mapped.normalizedIndex == thesaurus.normalizedIndex
+
+def completionResults( rogetThesaurus ):
+    return [ rogetThesaurus.completions( prefix, limit ) for (prefix, limit) in [ ( 'lov', 10 ), ( 'at the', 5 ), ( 'x', 100 ), ( 'no such prefix', 10 ), ( '', 3 ) ] ]
+
+def test_completions( rogetThesaurus ):
+    print(' *** test completions *** ')
+    keys = sorted( rogetThesaurus.senseIndex )
+    for prefix in [ 'lov', 'at the', 'x', 'no such prefix', 'Ex' ]:
+        expected = [ key for key in keys if key.startswith( prefix ) ]
+        assert list( rogetThesaurus.iterCompletions( prefix ) ) == expected
+        assert rogetThesaurus.completions( prefix ) == expected[ : 10 ]
+    assert rogetThesaurus.completions( 'lov', 3 ) == [ 'lovable', 'love', 'love affair' ]
+    assert len( list( rogetThesaurus.iterCompletions( '' ) ) ) == len( keys )
+
+    tm = time.time()
+    for _ in range( 10000 ):
+        rogetThesaurus.completions( 'lov' )
+    print("time for 10000 completions: ", time.time() - tm)
+
+    expected = completionResults( rogetThesaurus )
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-binary' )
+        parser = roget.RogetBuilder()
+        parser.store( rogetThesaurus, fileName )
+        assert completionResults( parser.load( fileName ) ) == expected
+        mapped = parser.load( fileName, mapped = True )
+        assert completionResults( mapped ) == expected
+
+        tm = time.time()
+        for _ in range( 10000 ):
+            mapped.completions( 'lov' )
+        print("time for 10000 completions in a mapped snapshot: ", time.time() - tm)
+
+def referenceEditDistance( a, b ):
+    """ optimal string alignment distance, the full table """
+    d = [ [ 0 ] * ( len(b) + 1 ) for _ in range( len(a) + 1 ) ]
+    for i in range( len(a) + 1 ):
+        d[i][0] = i
+    for j in range( len(b) + 1 ):
+        d[0][j] = j
+    for i in range( 1, len(a) + 1 ):
+        for j in range( 1, len(b) + 1 ):
+            d[i][j] = min( d[i-1][j] + 1, d[i][j-1] + 1, d[i-1][j-1] + ( a[i-1] != b[j-1] ) )
+            if i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                d[i][j] = min( d[i][j], d[i-2][j-2] + 1 )
+    return d[ len(a) ][ len(b) ]
+
+def typo( rand, word ):
+    """ applies up to two random edits to word """
+    chars = list( word )
+    for _ in range( rand.choice( [ 0, 1, 2 ] ) ):
+        pos = rand.randrange( len( chars ) ) if chars else 0
+        edit = rand.choice( 'dist' )
+        if edit == 'd' and chars:
+            del chars[ pos ]
+        elif edit == 'i':
+            chars.insert( pos, rand.choice( 'aeixq' ) )
+        elif edit == 't' and pos + 1 < len( chars ):
+            chars[ pos ], chars[ pos + 1 ] = chars[ pos + 1 ], chars[ pos ]
+        elif chars:
+            chars[ pos ] = rand.choice( 'aeixq' )
+    return ''.join( chars )
+
+def test_fuzzy_lookup( rogetThesaurus ):
+    print(' *** test fuzzy lookup *** ')
+    rand = random.Random( 2 )
+    keys = sorted( rogetThesaurus.senseIndex )
+    editDistance = roget.roget_parser._editDistance
+    for _ in range( 2000 ):
+        a = rand.choice( keys ).casefold()
+        b = typo( rand, a ) if rand.random() < 0.7 else rand.choice( keys ).casefold()
+        assert editDistance( a, b, 2 ) == min( referenceEditDistance( a, b ), 3 ), ( a, b )
+
+    tm = time.time()
+    thesaurus = roget.RogetBuilder().parse( fuzzyIndex = True )
+    print("time to parse and build the fuzzy index: ", time.time() - tm)
+
+    assert [ ( key, distance ) for (key, distance, _) in thesaurus.fuzzyLookup( 'existance' ) ][ : 2 ] == [ ( 'Existence', 1 ), ( 'existence', 1 ) ]
+    assert [ ( key, distance ) for (key, distance, _) in thesaurus.fuzzyLookup( 'at the vrey momnet' ) ] == [ ( 'at the very moment', 2 ) ]
+    (key, distance, senses) = thesaurus.fuzzyLookup( 'lvoe', 1 )[1]
+    assert ( key, distance ) == ( 'love', 1 ) and senses == thesaurus.senseIndex[ 'love' ]
+    assert thesaurus.fuzzyLookup( 'qqqqqqqqqqqq' ) == []
+
+    queries = [ typo( rand, rand.choice( keys ) ) for _ in range( 2000 ) ]
+    tm = time.time()
+    for query in queries:
+        thesaurus.fuzzyLookup( query )
+    print("time per fuzzy lookup: ", ( time.time() - tm ) / len( queries ))
+
+    # the same result as comparing with each key
+    folded = [ ( key.casefold(), key ) for key in keys ]
+    for query in queries[ : 5 ] + [ 'lvoe' ]:
+        q = query.casefold()
+        expected = sorted( ( editDistance( q, f, 2 ), key ) for (f, key) in folded if editDistance( q, f, 2 ) <= 2 )
+        assert [ ( distance, key ) for (key, distance, _) in thesaurus.fuzzyLookup( query ) ] == expected, query
+
+def test_phrases_containing( rogetThesaurus ):
+    print(' *** test phrases containing *** ')
+    phrases = [ n for n in roget.roget_parser._iterPreorder( rogetThesaurus.rootNode )
+                if n.type in ( roget.ROGET_NODE_SENSE, roget.ROGET_NODE_HEADWORD ) and len( roget.roget_parser._tokens( n.key ) ) > 1 ]
+    for tokens in [ ( 'moment', ), ( 'the', 'of' ), ( 'moment', 'the' ), ( 'fresh', 'as', 'a', 'daisy' ), ( 'Moment', ), ( 'the', 'no-such-token' ) ]:
+        expected = [ n for n in phrases if all( t in roget.roget_parser._tokens( n.key ) for t in roget.roget_parser._tokens( ' '.join( tokens ) ) ) ]
+        assert rogetThesaurus.phrasesContaining( *tokens ) == expected, tokens
+    assert 'at the very moment' in [ n.key for n in rogetThesaurus.phrasesContaining( 'moment' ) ]
+    assert [ n.key for n in rogetThesaurus.phrasesContaining( 'fresh', 'daisy' ) ] == [ 'fresh as a daisy' ] * 2
+    assert rogetThesaurus.phrasesContaining( 'very moment' ) == rogetThesaurus.phrasesContaining( 'very', 'moment' )
+    assert rogetThesaurus.phrasesContaining() == []
+
+    tm = time.time()
+    for _ in range( 1000 ):
+        rogetThesaurus.phrasesContaining( 'moment', 'the' )
+    print("time for 1000 phrase lookups: ", time.time() - tm)
+
+def treeResults( rogetThesaurus ):
+    nodes = [ ( n.type, n.key, n.internalId, n.parent.internalId if n.parent != None else None ) for n in roget.roget_parser._iterPreorder( rogetThesaurus.rootNode ) ]
+    links = [ ( n.internalId, n.link.internalId if n.link != None else None, n.comment, n.wordType )
+              for senses in rogetThesaurus.senseIndex.values() for n in senses ]
+    headWords = sorted( ( index, n.internalId ) for (index, n) in rogetThesaurus.headWordIndex.items() )
+    senses = sorted( ( key, [ n.internalId for n in senses ] ) for (key, senses) in rogetThesaurus.senseIndex.items() )
+    return ( nodes, sorted( links, key = lambda elm: elm[0] ), headWords, senses )
+
+def test_update( rogetThesaurus ):
+    print(' *** test update *** ')
+    textFile = os.path.join( os.path.dirname( roget.roget_parser.__file__ ), '10681-body.py' )
+    with open( textFile ) as f:
+        text = f.read()
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-text' )
+        def writeText( newText ):
+            with open( fileName, 'w' ) as f:
+                f.write( newText )
+
+        writeText( text )
+        builder = roget.RogetBuilder( textFile = fileName )
+        thesaurus = builder.parse()
+        assert builder.update( thesaurus ) is thesaurus
+        thesaurus.precomputeSimilarity()
+        thesaurus.lookupNormalized( 'love' )
+
+        # a typo fix: the senses keep their internal ids
+        fixed = text.replace( 'paleolontological', 'paleontological' )
+        writeText( fixed )
+        tm = time.time()
+        assert builder.update( thesaurus ) is thesaurus
+        print("time to update after a one word fix: ", time.time() - tm)
+        expected = builder.parse()
+        assert treeResults( thesaurus ) == treeResults( expected )
+        assert 'paleontological' in thesaurus.senseIndex and not 'paleolontological' in thesaurus.senseIndex
+        assert thesaurus.lookupNormalized( 'paleontological' ) == ( 'paleontological', )
+        assert similarityResults( thesaurus ) == similarityResults( expected )
+
+        # new senses and links in two head words: all nodes after the first change are numbered again
+        changed = fixed.replace( 'maturity; decline, decay;', 'maturity; decline, decay, agedness &amp;c 128, oldishness;' )
+        changed = changed.replace( '1. Existence -- N. existence, being,', '1. Existence -- N. existence, being, actuality,' )
+        writeText( changed )
+        tm = time.time()
+        assert builder.update( thesaurus ) is thesaurus
+        print("time to update after adding senses: ", time.time() - tm)
+        expected = builder.parse()
+        assert treeResults( thesaurus ) == treeResults( expected )
+        assert thesaurus.senseIndex[ 'agedness' ][0].link is thesaurus.headWordIndex[ '128' ]
+        assert [ n.parent.parent for n in thesaurus.senseIndex[ 'oldishness' ] ] == [ thesaurus.headWordIndex[ '124' ] ]
+        assert similarityResults( thesaurus ) == similarityResults( expected )
+        assert formatText( thesaurus ) == formatText( expected )
+
+        # changes of the structure or of a head word are parsed as a whole
+        for newText in [ changed.replace( '1. BEING, IN THE ABSTRACT', '1. BEING IN THE ABSTRACT' ),
+                         changed.replace( '124. Oldness --', '124. Agedness --' ),
+                         changed.replace( 'fade, senesce.\n', 'fade, senesce.\n\n' ) ]:
+            writeText( newText )
+            updated = builder.update( thesaurus )
+            assert not updated is thesaurus
+            assert treeResults( updated ) == treeResults( builder.parse() )
+
+        # an unresolved link does not change the thesaurus
+        writeText( changed.replace( 'agedness &amp;c 128', 'agedness &amp;c 9999' ) )
+        try:
+            builder.update( thesaurus )
+            assert False, "unresolved link was accepted"
+        except Exception as e:
+            assert 'unresolved link' in str( e )
+        assert treeResults( thesaurus ) == treeResults( expected )
+
+    # a thesaurus from a lazy parse (or from a snapshot) is parsed again
+    lazy = roget.RogetBuilder().parse( lazy = True )
+    updated = roget.RogetBuilder().update( lazy )
+    assert not updated is lazy and indexSizes( updated ) == indexSizes( rogetThesaurus )
+
+def test_lazy_parse( rogetThesaurus ):
+    print(' *** test lazy parse *** ')
+    tm = time.time()
+    lazy = roget.RogetBuilder().parse( lazy = True )
+    print("time to parse lazily: ", time.time() - tm)
+
+    tracemalloc.start()
+    try:
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        other = roget.RogetBuilder().parse( lazy = True )
+        gc.collect()
+        lazyMemory = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    other = None
+    print("memory of a lazily parsed thesaurus: ", lazyMemory)
+    assert lazyMemory < 2 * 1024 * 1024
+
+    def loadedHeadWords():
+        return [ index for (index, headWord) in lazy.headWordIndex.items() if headWord._lazy == None ]
+
+    assert len( lazy.headWordIndex ) == len( rogetThesaurus.headWordIndex ) and loadedHeadWords() == []
+    assert lazy.headWordIndex[ '124' ].toString() == rogetThesaurus.headWordIndex[ '124' ].toString()
+    assert [ c.key for c in lazy.rootNode.child ] == [ c.key for c in rogetThesaurus.rootNode.child ]
+    assert loadedHeadWords() == []
+
+    # a head word is parsed on first access of its child nodes, with the internal ids of a full parse
+    def subtree( thesaurus, index ):
+        return [ ( n.internalId, n.toString(), n.parent.internalId ) for n in roget.roget_parser._iterPreorder( thesaurus.headWordIndex[ index ] ) ]
+    assert subtree( lazy, '124' ) == subtree( rogetThesaurus, '124' )
+    assert loadedHeadWords() == [ '124' ]
+    children = lazy.headWordIndex[ '124' ].child
+    assert lazy.headWordIndex[ '124' ].child is children
+
+    # head words that are used by several threads at once are parsed once
+    with concurrent.futures.ThreadPoolExecutor( max_workers = 8 ) as executor:
+        results = list( executor.map( lambda index: lazy.headWordIndex[ index ].child, [ '123', '125', '1' ] * 8 ) )
+    assert all( results[i] is results[ i % 3 ] for i in range( len( results ) ) )
+    assert sorted( loadedHeadWords() ) == [ '1', '123', '124', '125' ]
+
+    # the sense index parses all head words
+    assert [ n.internalId for n in lazy.senseIndex[ 'fact' ] ] == [ n.internalId for n in rogetThesaurus.senseIndex[ 'fact' ] ]
+    assert len( loadedHeadWords() ) == len( lazy.headWordIndex )
+    assert treeResults( lazy ) == treeResults( rogetThesaurus )
+    assert similarityResults( lazy ) == similarityResults( rogetThesaurus )
+    assert formatText( lazy ) == formatText( rogetThesaurus )
+
+    # a text with \r\n line ends gives the same tree, parsed at once, lazily or head word by head word
+    textFile = os.path.join( os.path.dirname( roget.roget_parser.__file__ ), '10681-body.py' )
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-text.py' )
+        with open( textFile, 'rb' ) as f:
+            text = f.read()
+        assert not b'\r' in text
+        with open( fileName, 'wb' ) as f:
+            f.write( text.replace( b'\n', b'\r\n' ) )
+        expected = formatText( rogetThesaurus )
+        assert formatText( roget.RogetBuilder( textFile = fileName ).parse() ) == expected
+        crlf = roget.RogetBuilder( textFile = fileName ).parse( lazy = True )
+        assert subtree( crlf, '124' ) == subtree( rogetThesaurus, '124' )
+        assert formatText( crlf ) == expected
+        for index in [ '1', '20a', '1000' ]:
+            headWord = roget.RogetBuilder( textFile = fileName ).getHeadWord( index )
+            assert [ n.toString() for n in roget.roget_parser._iterPreorder( headWord ) ] == \
+                   [ n.toString() for n in roget.roget_parser._iterPreorder( rogetThesaurus.headWordIndex[ index ] ) ]
+
+def test_get_head_word( rogetThesaurus ):
+    print(' *** test get head word *** ')
+    textFile = os.path.join( os.path.dirname( roget.roget_parser.__file__ ), '10681-body.py' )
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-text.py' )
+        indexFile = os.path.join( tmpDir, 'roget-text.idx' )
+        shutil.copy( textFile, fileName )
+
+        # the offset index is built on first use
+        tm = time.time()
+        headWord = roget.RogetBuilder( textFile = fileName ).getHeadWord( '124' )
+        print("time to get a head word and build the offset index: ", time.time() - tm)
+        assert os.access( indexFile, os.F_OK )
+        indexTime = os.stat( indexFile ).st_mtime_ns
+
+        def subtree( headWord ):
+            return [ ( n.internalId, n.toString() ) for n in roget.roget_parser._iterPreorder( headWord ) ]
+        assert subtree( headWord ) == subtree( rogetThesaurus.headWordIndex[ '124' ] )
+        assert headWord.parent == None
+
+        # a new builder reads the stored offset index
+        builder = roget.RogetBuilder( textFile = fileName )
+        tm = time.time()
+        headWord = builder.getHeadWord( '20a' )
+        print("time to get a head word with a stored offset index: ", time.time() - tm)
+        tm = time.time()
+        for index in [ '1', '59a', '1000' ]:
+            builder.getHeadWord( index ).toString()
+        print("time to get three more head words: ", time.time() - tm)
+        assert os.stat( indexFile ).st_mtime_ns == indexTime
+        assert headWord.toString() == rogetThesaurus.headWordIndex[ '20a' ].toString()
+        assert subtree( headWord ) == subtree( rogetThesaurus.headWordIndex[ '20a' ] )
+        assert builder.getHeadWord( '20a' ) is headWord
+        assert builder.getHeadWord( '9999' ) == None
+
+        # a truncated offset index is built again
+        with open( indexFile, 'rb' ) as f:
+            index = f.read()
+        header = roget.roget_parser._OFFSET_INDEX_HEADER.size
+        for size in [ header + len( rogetThesaurus.headWordIndex ) * 20, len( index ) - 1, header - 1 ]:
+            with open( indexFile, 'wb' ) as f:
+                f.write( index[ : size ] )
+            builder = roget.RogetBuilder( textFile = fileName )
+            assert builder.getHeadWord( '1' ).toString() == rogetThesaurus.headWordIndex[ '1' ].toString()
+            assert builder.getHeadWord( '20a' ).toString() == headWord.toString()
+            with open( indexFile, 'rb' ) as f:
+                assert f.read() == index
+        assert sorted( os.listdir( tmpDir ) ) == [ 'roget-text.idx', 'roget-text.py' ]
+
+        # links are read on first use
+        link = [ n for n in roget.roget_parser._iterPreorder( builder.getHeadWord( '124' ) ) if n.type == roget.ROGET_NODE_SENSE and n.link != None ][0].link
+        assert link is builder.getHeadWord( link.index )
+        assert subtree( link ) == subtree( rogetThesaurus.headWordIndex[ link.index ] )
+
+        # the offset index is built again after the text has changed
+        with open( fileName ) as f:
+            text = f.read()
+        with open( fileName, 'w' ) as f:
+            f.write( text.replace( '124. Oldness -- N. oldness', '124. Oldness -- N. oldness, agedness' ) )
+        def keys( headWord ):
+            return [ n.key for n in roget.roget_parser._iterPreorder( headWord ) ]
+        assert 'agedness' in keys( builder.getHeadWord( '124' ) ) and not 'agedness' in keys( rogetThesaurus.headWordIndex[ '124' ] )
+        changed = roget.RogetBuilder( textFile = fileName ).parse()
+        assert subtree( roget.RogetBuilder( textFile = fileName ).getHeadWord( '125' ) ) == subtree( changed.headWordIndex[ '125' ] )
+        assert subtree( builder.getHeadWord( '124' ) ) == subtree( changed.headWordIndex[ '124' ] )
+
+        assert 'agedness' in keys( roget.RogetBuilder( textFile = fileName ).getHeadWord( '124', os.path.join( tmpDir, 'other.idx' ) ) )
+        assert os.access( os.path.join( tmpDir, 'other.idx' ), os.F_OK )
+
+def recursivePreorder( node, depth, ret ):
+    """ the nodes of the subtree as ( depth, node ), as the recursive walkers did before the traversal without recursion """
+    ret.append( ( depth, node ) )
+    for c in node.child:
+        recursivePreorder( c, depth + 1, ret )
+    return ret
+
+def recursivePostorder( node, ret ):
+    for c in node.child:
+        recursivePostorder( c, ret )
+    ret.append( node )
+    return ret
+
+def formatXML( rogetThesaurus, root = None, mask = 0xF ):
+    out = io.StringIO()
+    roget.RogetThesaurusFormatterXML().show( rogetThesaurus, out, root, mask )
+    return out.getvalue()
+
+def test_traversal( rogetThesaurus ):
+    print(' *** test traversal *** ')
+    root = rogetThesaurus.rootNode
+    assert list( roget.roget_parser._iterPreorderDepth( root ) ) == recursivePreorder( root, 0, [] )
+    assert list( roget.roget_parser._iterPostorder( root ) ) == recursivePostorder( root, [] )
+    headWord = rogetThesaurus.headWordIndex[ '124' ]
+    assert list( roget.roget_parser._iterPreorderDepth( headWord, 3 ) ) == recursivePreorder( headWord, 3, [] )
+
+    # a tree that is deeper than the recursion limit
+    depth = sys.getrecursionlimit() * 2
+    deepRoot = roget.RogetNode( roget.ROGET_NODE_CATEGORY, 'root' )
+    node = deepRoot
+    for i in range( depth ):
+        node = roget.RogetNode( roget.ROGET_NODE_CATEGORY, 'level ' + str( i ), node )
+        node._key = str( i )
+    deep = roget.RogetThesaurus( deepRoot, {}, {} )
+    lines = formatText( deep ).split( '\n' )
+    assert len( lines ) == depth + 2 and lines[ depth ] == '\t' * depth + 'Category - level ' + str( depth - 1 ) + ' (' + str( depth - 1 ) + ')'
+    # the deepest category is an empty element
+    assert formatXML( deep ).count( '</Category>' ) == depth
+    assert len( list( roget.roget_parser._iterPostorder( deepRoot ) ) ) == depth + 1
+
+XML_WORD_TYPES = { roget.WORD_TYPE_ADJ : 'Adj', roget.WORD_TYPE_VERB : 'V', roget.WORD_TYPE_ADVERB : 'Adv', roget.WORD_TYPE_NOUN : 'N',
+                   roget.WORD_TYPE_PHRASE : 'Phr' }
+
+def xmlAttributes( node ):
+    """ the attributes of the xml element of node """
+    if node.type == roget.ROGET_NODE_CATEGORY:
+        return { 'name' : node.key }
+    ret = {}
+    if node.type == roget.ROGET_NODE_HEADWORD:
+        ret['id'] = node.index
+    if node.type != roget.ROGET_NODE_SENSE_GROUP:
+        ret['sense'] = node.key
+        if node.wordType != roget.WORD_TYPE_NONE:
+            ret['wordType'] = XML_WORD_TYPES[ node.wordType ]
+        if node.comment != '':
+            ret['comment'] = node.comment
+        if node.link != None:
+            ret['link'] = node.link.index
+            ret['linkComment'] = node.link.key
+    return ret
+
+def xmlNodes( text ):
+    """ the elements of the ontology in document order: ( tag, attributes, number of child elements ) """
+    ontology = xml.etree.ElementTree.fromstring( text ).find( 'ontology' )
+    return [ ( e.tag, e.attrib, len( e ) ) for e in ontology.iter() ][ 1 : ]
+
+def test_xml_export( rogetThesaurus ):
+    print(' *** test xml export *** ')
+    tm = time.time()
+    text = formatXML( rogetThesaurus )
+    print("time to export xml: ", time.time() - tm)
+
+    # well formed, with one element for each node, in the same order and with the same number of children
+    nodes = list( rogetThesaurus.iterNodes() )
+    assert xmlNodes( text ) == [ ( n.typeToString(), xmlAttributes( n ), len( n.child ) ) for n in nodes ]
+
+    # the special characters are escaped
+    root = roget.RogetNode( roget.ROGET_NODE_CATEGORY, 'root' )
+    root._key = 'a & b <c> "d"'
+    sense = roget.Sense( roget.ROGET_NODE_SENSE, root )
+    sense._key = 'fish & chips'
+    sense._comment = '&amp; <\t'
+    special = roget.RogetThesaurus( root, {}, { sense.key : [ sense ] } )
+    assert xmlNodes( formatXML( special ) ) == [ ( 'Category', { 'name' : root.key }, 1 ), ( 'Sense', { 'sense' : 'fish & chips', 'comment' : '&amp; <\t' }, 0 ) ]
+
+    # subtrees and node types
+    headWord = rogetThesaurus.headWordIndex[ '124' ]
+    section = headWord.parent
+    mask = roget.ROGET_NODE_CATEGORY | roget.ROGET_NODE_HEADWORD
+    assert xmlNodes( formatXML( rogetThesaurus, section, mask ) ) == \
+           [ ( n.typeToString(), xmlAttributes( n ), len( n.child ) if n.type == roget.ROGET_NODE_CATEGORY else 0 ) for n in rogetThesaurus.iterNodes( mask, section ) ]
+    assert xmlNodes( formatXML( rogetThesaurus, headWord, roget.ROGET_NODE_SENSE ) ) == \
+           [ ( 'Sense', xmlAttributes( n ), 0 ) for n in rogetThesaurus.iterSenses( headWord ) ]
+    # all combinations of node types: one element for each visited node, in the same order
+    for mask in range( 1, 0x10 ):
+        assert [ ( tag, attributes ) for (tag, attributes, _) in xmlNodes( formatXML( rogetThesaurus, section, mask ) ) ] == \
+               [ ( n.typeToString(), xmlAttributes( n ) ) for n in rogetThesaurus.iterNodes( mask, section ) ], mask
+    # the elements of a subtree are as in the whole ontology
+    lines = formatXML( rogetThesaurus, headWord ).split( '\n' )
+    assert lines[ 3 ].startswith( '<Headword id="124"' ) and '\n'.join( lines[ 3 : -3 ] ) in text
+
+    # the output is written in chunks, and can be compressed
+    writes = []
+    roget.RogetThesaurusFormatterXML().show( rogetThesaurus, type( 'CountingFile', (), { 'write' : lambda self, s: writes.append( len( s ) ) } )() )
+    assert len( writes ) < len( nodes ) / 1000 and sum( writes ) == len( text )
+    out = io.BytesIO()
+    roget.RogetThesaurusFormatterXML().show( rogetThesaurus, out, compress = True )
+    assert gzip.decompress( out.getvalue() ).decode() == text
+    print("size of the xml: ", len( text ), " compressed: ", len( out.getvalue() ))
+
+def formatJSONL( rogetThesaurus, root = None, mask = 0xF ):
+    out = io.StringIO()
+    roget.RogetThesaurusFormatterJSONL().show( rogetThesaurus, out, root, mask )
+    return out.getvalue()
+
+def jsonlRecord( node ):
+    """ the expected record of node """
+    path = []
+    n = node.parent
+    while n != None:
+        path.insert( 0, n.internalId )
+        n = n.parent
+    isSense = node.type in ( roget.ROGET_NODE_SENSE, roget.ROGET_NODE_HEADWORD )
+    return { 'id' : node.internalId, 'parent' : path[-1] if path else None, 'type' : node.typeToString(), 'key' : node.key,
+             'index' : node.index if node.type == roget.ROGET_NODE_HEADWORD else None,
+             'wordType' : XML_WORD_TYPES.get( node.wordType ) if isSense else None,
+             'comment' : node.comment if isSense and node.comment != '' else None,
+             'link' : node.link.index if isSense and node.link != None else None, 'path' : path }
+
+def jsonlRecords( text ):
+    """ the records of the json lines in text (split at new lines only: splitlines would also split at \\u2028) """
+    return [ json.loads( line ) for line in text.split( '\n' )[ : -1 ] ]
+
+def test_jsonl_export( rogetThesaurus ):
+    print(' *** test jsonl export *** ')
+    tm = time.time()
+    text = formatJSONL( rogetThesaurus )
+    print("time to export json lines: ", time.time() - tm)
+
+    # one record per line for each node, in preorder
+    nodes = list( rogetThesaurus.iterNodes() )
+    lines = text.split( '\n' )
+    assert lines[-1] == '' and len( lines ) == len( nodes ) + 1
+    assert jsonlRecords( text ) == [ jsonlRecord( n ) for n in nodes ]
+
+    # special characters
+    root = roget.RogetNode( roget.ROGET_NODE_CATEGORY, 'root' )
+    root._key = 'a "b" \\ c\t\u00e9\u2028'
+    sense = roget.Sense( roget.ROGET_NODE_SENSE, root )
+    sense._key = 'fish & chips'
+    sense._comment = '\n\x01'
+    special = roget.RogetThesaurus( root, {}, { sense.key : [ sense ] } )
+    specialText = formatJSONL( special )
+    assert jsonlRecords( specialText ) == [ jsonlRecord( root ), jsonlRecord( sense ) ]
+
+    # the output does not depend on orjson
+    parser = sys.modules[ 'roget.roget_parser' ]
+    orjson = parser.orjson
+    try:
+        parser.orjson = None
+        assert formatJSONL( rogetThesaurus ) == text and formatJSONL( special ) == specialText
+    finally:
+        parser.orjson = orjson
+    print("orjson installed: ", orjson != None)
+
+    # subtrees and node types: parent and path refer to the whole ontology
+    headWord = rogetThesaurus.headWordIndex[ '124' ]
+    mask = roget.ROGET_NODE_CATEGORY | roget.ROGET_NODE_HEADWORD
+    for (root, mask) in [ ( headWord.parent, mask ), ( headWord, roget.ROGET_NODE_SENSE ), ( headWord, 0xF ), ( None, roget.ROGET_NODE_HEADWORD ) ]:
+        assert jsonlRecords( formatJSONL( rogetThesaurus, root, mask ) ) == \
+               [ jsonlRecord( n ) for n in rogetThesaurus.iterNodes( mask, root ) ]
+
+    # a lazily parsed and a stored thesaurus give the same output
+    assert formatJSONL( roget.RogetBuilder().parse( lazy = True ) ) == text
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-binary' )
+        roget.RogetBuilder().store( rogetThesaurus, fileName )
+        assert formatJSONL( roget.RogetBuilder().load( fileName ) ) == text
+        assert formatJSONL( roget.RogetBuilder().load( fileName, mapped = True ) ) == text
+
+    # the output is written in chunks, and can be compressed
+    writes = []
+    roget.RogetThesaurusFormatterJSONL().show( rogetThesaurus, type( 'CountingFile', (), { 'write' : lambda self, s: writes.append( len( s ) ) } )() )
+    assert len( writes ) < len( nodes ) / 1000 and sum( writes ) == len( text )
+    out = io.BytesIO()
+    roget.RogetThesaurusFormatterJSONL().show( rogetThesaurus, out, compress = True )
+    assert gzip.decompress( out.getvalue() ).decode() == text
+    print("size of the json lines: ", len( text ), " compressed: ", len( out.getvalue() ))
+
+def jsonlReference( nodes ):
+    """ the expected json lines of nodes, formatted by json.dumps """
+    return ''.join( json.dumps( jsonlRecord( n ), ensure_ascii = False, separators = ( ',', ':' ) ) + '\n' for n in nodes )
+
+def test_jsonl_fallback( rogetThesaurus ):
+    print(' *** test jsonl export without orjson *** ')
+    text = formatJSONL( rogetThesaurus )
+    assert text == jsonlReference( rogetThesaurus.iterNodes() )
+
+    root = roget.RogetNode( roget.ROGET_NODE_CATEGORY, 'root' )
+    root._key = 'a "b" \\ c\t\u00e9\u2028\ud7ff'
+    sense = roget.Sense( roget.ROGET_NODE_SENSE, root )
+    sense._key = 'fish & chips </x>'
+    sense._comment = '\n\x01\x7f'
+    special = roget.RogetThesaurus( root, {}, { sense.key : [ sense ] } )
+    assert formatJSONL( special ) == jsonlReference( [ root, sense ] )
+
+    # a process in which orjson can't be imported writes the same bytes
+    script = '''
+import sys, io
+sys.modules[ 'orjson' ] = None
+import roget
+assert sys.modules[ 'roget.roget_parser' ].orjson == None
+out = io.StringIO()
+roget.RogetThesaurusFormatterJSONL().show( roget.RogetBuilder().parse(), out )
+sys.stdout.buffer.write( out.getvalue().encode() )
+'''
+    env = dict( os.environ, PYTHONPATH = os.path.dirname( os.path.dirname( roget.__file__ ) ) )
+    result = subprocess.run( [ sys.executable, '-c', script ], env = env, stdout = subprocess.PIPE, check = True )
+    assert result.stdout == text.encode()
+
+def test_iter_nodes( rogetThesaurus ):
+    print(' *** test iter nodes *** ')
+    root = rogetThesaurus.rootNode
+    nodes = recursivePreorder( root, 0, [] )
+    # all combinations of node types: the walk skips the nodes below a head word unless senses or sense groups are visited
+    for mask in range( 1, 0x10 ):
+        assert list( rogetThesaurus.iterNodes( mask, depth = True ) ) == [ ( d, n ) for (d, n) in nodes if n.type & mask ], mask
+    assert list( rogetThesaurus.iterNodes() ) == [ n for (_, n) in nodes ]
+    assert list( rogetThesaurus.iterSenses() ) == [ n for (_, n) in nodes if n.type == roget.ROGET_NODE_SENSE ]
+    assert list( rogetThesaurus.iterHeadWords() ) == [ n for (_, n) in nodes if n.type == roget.ROGET_NODE_HEADWORD ]
+
+    # the depth of a subtree is its depth in the ontology
+    headWord = rogetThesaurus.headWordIndex[ '124' ]
+    headWordDepth = [ d for (d, n) in nodes if n is headWord ][0]
+    assert list( rogetThesaurus.iterSenses( headWord, depth = True ) ) == [ ( d, n ) for (d, n) in recursivePreorder( headWord, headWordDepth, [] ) if n.type == roget.ROGET_NODE_SENSE ]
+    assert list( rogetThesaurus.iterHeadWords( headWord.parent ) )[0] is headWord.parent.child[0]
+
+    # the nodes are visited as the generator is consumed
+    lazy = roget.RogetBuilder().parse( lazy = True )
+    def loadedHeadWords():
+        return [ index for (index, headWord) in lazy.headWordIndex.items() if headWord._lazy == None ]
+    assert [ n.index for n in lazy.iterHeadWords() ] == [ n.index for n in rogetThesaurus.iterHeadWords() ]
+    assert loadedHeadWords() == []
+    assert [ n.toString() for n in itertools.islice( lazy.iterSenses(), 20 ) ] == [ n.toString() for n in itertools.islice( rogetThesaurus.iterSenses(), 20 ) ]
+    assert loadedHeadWords() == [ '1' ]
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-binary' )
+        roget.RogetBuilder().store( rogetThesaurus, fileName )
+        mapped = roget.RogetBuilder().load( fileName, mapped = True )
+        assert [ ( d, n.toString() ) for (d, n) in mapped.iterNodes( roget.ROGET_NODE_CATEGORY | roget.ROGET_NODE_HEADWORD, depth = True ) ] == \
+               [ ( d, n.toString() ) for (d, n) in nodes if n.type & ( roget.ROGET_NODE_CATEGORY | roget.ROGET_NODE_HEADWORD ) ]
+        mappedHeadWord = mapped.headWordIndex[ '124' ]
+        assert [ n.key for n in mapped.iterSenses( mappedHeadWord ) ] == [ n.key for n in rogetThesaurus.iterSenses( headWord ) ]
+
+def test_threaded_builds( rogetThesaurus ):
+    print(' *** test builds on 8 threads *** ')
+    expectedIds = [ n.internalId for n in roget.roget_parser._iterPreorder( rogetThesaurus.rootNode ) ]
+    assert expectedIds == list( range( 1, len( expectedIds ) + 1 ) )
+    expectedSimilarity = similarityResults( rogetThesaurus )
+
+    def build( _ ):
+        thesaurus = roget.RogetBuilder().parse()
+        ids = [ n.internalId for n in roget.roget_parser._iterPreorder( thesaurus.rootNode ) ]
+        return ( ids, similarityResults( thesaurus ) )
+
+    tm = time.time()
+    with concurrent.futures.ThreadPoolExecutor( max_workers = 8 ) as executor:
+        results = list( executor.map( build, range( 8 ) ) )
+    print("time for 8 builds on 8 threads: ", time.time() - tm)
+
+    for (ids, similarity) in results:
+        assert ids == expectedIds
+        assert similarity == expectedSimilarity
+    assert gc.isenabled()
+
+class DictLayoutNode:
+    """ the node layout before __slots__: a __dict__ per node and a child list for each node, leaves included """
+    def __init__(self, node, parent):
+        self._type = node._type
+        self._description = node._description
+        self._parent = parent
+        self._child = []
+        self._key = node._key
+        self._internalId = node._internalId
+        if node._type == roget.ROGET_NODE_HEADWORD or node._type == roget.ROGET_NODE_SENSE:
+            self._comment = node._comment
+            self._link = node._link
+            self._linkComment = node._linkComment
+            self._wordType = node._wordType
+            if node._type == roget.ROGET_NODE_HEADWORD:
+                self._index = node._index
+        if parent != None:
+            parent._child.append( self )
+
+def slottedCopy( node, parent ):
+    if node._type == roget.ROGET_NODE_HEADWORD:
+        ret = roget.HeadWord( node._index, parent )
+    elif node._type == roget.ROGET_NODE_SENSE:
+        ret = roget.Sense( node._type, parent )
+    else:
+        ret = roget.RogetNode( node._type, node._description, parent )
+    ret._key = node._key
+    ret._internalId = node._internalId
+    if node._type == roget.ROGET_NODE_HEADWORD or node._type == roget.ROGET_NODE_SENSE:
+        ret._comment = node._comment
+        ret._link = node._link
+        ret._linkComment = node._linkComment
+        ret._wordType = node._wordType
+    return ret
+
+def treeCopyMemory( rogetThesaurus, copyNode ):
+    """ memory (as reported by tracemalloc) of a copy of all nodes; the copy shares the strings of the original """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        copies = {}
+        for n in roget.roget_parser._iterPreorder( rogetThesaurus.rootNode ):
+            copies[ n ] = copyNode( n, copies.get( n.parent ) )
+        # the map from original to copy is not part of the tree
+        copies = list( copies.values() )
+        return tracemalloc.get_traced_memory()[0] - sys.getsizeof( copies )
+    finally:
+        tracemalloc.stop()
+
+def test_node_memory( rogetThesaurus ):
+    print(' *** test node memory *** ')
+    for n in [ rogetThesaurus.rootNode, rogetThesaurus.headWordIndex[ '1' ], rogetThesaurus.senseIndex[ 'fact' ][0] ]:
+        assert not hasattr( n, '__dict__' )
+    leaf = rogetThesaurus.senseIndex[ 'fact' ][0]
+    assert leaf.child == () and leaf.child is rogetThesaurus.senseIndex[ 'fiction' ][0].child
+
+    dictLayout = treeCopyMemory( rogetThesaurus, DictLayoutNode )
+    slotsLayout = treeCopyMemory( rogetThesaurus, slottedCopy )
+    print("memory of all nodes with __dict__: ", dictLayout, " with __slots__: ", slotsLayout)
+    assert slotsLayout < dictLayout
+
+def arraysResults( arrays, rogetThesaurus ):
+    headWord = rogetThesaurus.headWordIndex[ '123' ].internalId - 1
+    return ( list( arrays.depths() ), list( arrays.subtreeEnds() ), list( arrays.sensesUnder( headWord ) ),
+             list( arrays.nodesUnder( 1, roget.ROGET_NODE_HEADWORD ) ), arrays.children( headWord ) )
+
+def test_arrays( rogetThesaurus ):
+    print(' *** test arrays *** ')
+    arrays = rogetThesaurus.arrays()
+    assert arrays is rogetThesaurus.arrays()
+    nodes = list( roget.roget_parser._iterPreorder( rogetThesaurus.rootNode ) )
+    assert len( arrays ) == len( nodes )
+
+    depths = []
+    for n in nodes:
+        depth = 0
+        while n.parent != None:
+            depth += 1
+            n = n.parent
+        depths.append( depth )
+    assert list( arrays.depths() ) == depths
+
+    headWord = rogetThesaurus.headWordIndex[ '123' ]
+    senses = [ n.internalId - 1 for n in roget.roget_parser._iterPreorder( headWord ) if n.type == roget.ROGET_NODE_SENSE ]
+    assert list( arrays.sensesUnder( headWord.internalId - 1 ) ) == senses
+    assert [ arrays.key( i ) for i in senses ] == [ arrays.node( i ).key for i in senses ]
+    assert arrays.children( headWord.internalId - 1 ) == [ n.internalId - 1 for n in headWord.child ]
+    for i in senses:
+        assert arrays.links[i] == ( arrays.node( i ).link.internalId - 1 if arrays.node( i ).link != None else -1 )
+    assert arrays.subtreeEnds()[0] == len( nodes )
+
+    expected = arraysResults( arrays, rogetThesaurus )
+
+    # without numpy
+    numpy = roget.roget_parser.numpy
+    roget.roget_parser.numpy = None
+    try:
+        assert arraysResults( roget.RogetThesaurusArrays.fromThesaurus( rogetThesaurus ), rogetThesaurus ) == expected
+    finally:
+        roget.roget_parser.numpy = numpy
+
+    with tempfile.TemporaryDirectory() as tmpDir:
+        fileName = os.path.join( tmpDir, 'roget-binary' )
+        parser = roget.RogetBuilder()
+        parser.store( rogetThesaurus, fileName )
+        assert arraysResults( parser.load( fileName ).arrays(), rogetThesaurus ) == expected
+        mapped = parser.load( fileName, mapped = True )
+        assert arraysResults( mapped.arrays(), rogetThesaurus ) == expected
+        assert mapped.arrays().key( 1 ) == arrays.key( 1 )
+
 def do_main():
     parser = roget.RogetBuilder( 1 )
 #   rogetThesaurus = parser.load( 'roget-binary' )
@@ -68,6 +1177,30 @@ def do_main():
     test_lookup( rogetThesaurus )
     test_similarity( rogetThesaurus )
     test_save( rogetThesaurus )
+    test_golden( rogetThesaurus )
+    test_snapshot( rogetThesaurus )
+    test_mapped_snapshot( rogetThesaurus )
+    test_parse_twice( rogetThesaurus )
+    test_node_memory( rogetThesaurus )
+    test_threaded_builds( rogetThesaurus )
+    test_arrays( rogetThesaurus )
+    test_similarity_signatures( rogetThesaurus )
+    test_similarity_batch( rogetThesaurus )
+    test_similarity_cache( rogetThesaurus )
+    test_pickle( rogetThesaurus )
+    test_lookup_api( rogetThesaurus )
+    test_normalized_index( rogetThesaurus )
+    test_completions( rogetThesaurus )
+    test_fuzzy_lookup( rogetThesaurus )
+    test_phrases_containing( rogetThesaurus )
+    test_update( rogetThesaurus )
+    test_lazy_parse( rogetThesaurus )
+    test_get_head_word( rogetThesaurus )
+    test_traversal( rogetThesaurus )
+    test_iter_nodes( rogetThesaurus )
+    test_xml_export( rogetThesaurus )
+    test_jsonl_export( rogetThesaurus )
+    test_jsonl_fallback( rogetThesaurus )
 
     print("*** test completed ***")
 